@@ -1,50 +1,206 @@
-from helper.searxng import GoogleSearch
-from helper.ollama import query_openai
-from database.db import get_chat_history
+import os
 
+from agents.pipeline import Pipeline, Stage, StageFailed
+from helper.searxng import GoogleSearch, search_engines
+from helper.semantic_cache import cached_query, cached_stream
+from helper.context_builder import build_context, truncate_to_tokens
+from helper.enrichment import ENRICH_ENABLED, enrich_results
+from helper.retrieval import hybrid_search
 
-def academic_search_agent(user_id, chat_id, query=None):
+# Per-stage timeouts in seconds
+STAGE_TIMEOUTS = {
+    "history": 5,
+    "related": 5,
+    "enrich": 15,  # Page fetches stop after ENRICH_TIMEOUT; past this the turn goes on without extracts
+    "search": 15,
+    "llm": 120,
+}
+
+# SearxNG engines queried by the academic search, e.g. "google scholar,arxiv,semantic scholar"
+ACADEMIC_ENGINES = [engine.strip() for engine in os.getenv("ACADEMIC_ENGINES", "google scholar").split(",")
+                    if engine.strip()]
+
+
+def fetch_history_context(ctx):
     """
-    Agent interface for academic search using SearxNG, Ollama, and user-specific history.
+    Stage: build the token-budgeted chat context (rolling summary + recent messages).
     """
-    print(f"Processing academic query for user {user_id}, chat ID {chat_id}.")
-
-    # Step 1: Fetch chat history from the user's database
-    chat_history = get_chat_history(user_id, chat_id)
-    if not chat_history:
-        print(f"No chat history found for user {user_id} and chat ID {chat_id}.")
-        context = "No prior context available."
-    else:
-        # Prepare a summary of the user's recent chat history
-        context = "\n".join([f"- {msg.content}" for msg in chat_history[-5:]])  # Last 5 messages
+    context = build_context(ctx["user_id"], ctx["chat_id"])
+    if not context:
+        print(f"No chat history found for user {ctx['user_id']} and chat ID {ctx['chat_id']}.")
+        return "No prior context available."
+    return context
 
-    # Step 2: Use the provided query or infer search intent from chat history
-    if not query:
-        query = f"Based on the chat history:\n{context}\nWhat should I search for?"
 
+def resolve_query(ctx):
+    """
+    Stage: use the provided query or infer search intent from chat history.
+    """
+    query = ctx["query"] or f"Based on the chat history:\n{ctx['history']}\nWhat should I search for?"
     print(f"Inferred query: {query}")
+    return query
+
+
+# Earlier messages from other chats added to the prompt
+RELATED_MESSAGES = 3
+RELATED_MESSAGE_TOKENS = 150
+
+
+def find_related_messages(ctx):
+    """
+    Stage: find relevant messages from the user's other chats (keyword + vector hybrid search).
+    Retrieval problems only cost the extra context, they never fail the pipeline: the stage is
+    optional, so a timeout (e.g. the first embedding model load) also leaves it empty.
+    """
+    try:
+        return hybrid_search(
+            ctx["user_id"], ctx["resolved_query"], top_k=RELATED_MESSAGES, exclude_chat_id=ctx["chat_id"]
+        )
+    except Exception as e:
+        print(f"Error finding related messages for user {ctx['user_id']}: {e}")
+        return []
+
 
-    # Step 3: Perform an academic search using SearxNG
-    search_results = GoogleSearch(query, engine="google scholar")
+def search_academic(ctx):
+    """
+    Stage: perform an academic search using SearxNG. Several ACADEMIC_ENGINES are queried
+    concurrently, each with its own timeout, and their results merged by URL.
+    """
+    if len(ACADEMIC_ENGINES) > 1:
+        search_results = search_engines(ctx["resolved_query"], ACADEMIC_ENGINES)
+    else:
+        search_results = GoogleSearch.search_searxng(ctx["resolved_query"], engine=ACADEMIC_ENGINES[0])
     if not search_results:
-        return "Failed to retrieve academic search results."
+        raise StageFailed("Failed to retrieve academic search results.")
+    return search_results
+
 
-    # Step 4: Prepare a summary of search results for Ollama
+def enrich_search_results(ctx):
+    """
+    Stage: fetch the pages of the top results and keep their passages most relevant to the query.
+    Optional: when it fails or times out, the prompt only lists the results.
+    """
+    try:
+        return enrich_results(ctx["resolved_query"], ctx["search"])
+    except Exception as e:
+        print(f"Error enriching search results: {e}")
+        return []
+
+
+def build_prompt(ctx):
+    """
+    Stage: prepare a summary of search results for Ollama.
+    """
     search_summary = "\n".join(
-        [f"- {result['title']}: {result['url']}" for result in search_results[:5]]
+        [f"- {result['title']}: {result['url']}" for result in ctx["search"][:5]]
     )
 
-    prompt = (
-        f"I conducted an academic search for user '{user_id}' with the query '{query}'. "
+    extracts = ""
+    if ctx.get("enrich"):
+        extracts = "Relevant extracts from the result pages:\n" + "\n".join(
+            f"- {passage['title']} ({passage['url']}): {passage['text']}" for passage in ctx["enrich"]
+        ) + "\n\n"
+
+    related = ""
+    if ctx.get("related"):
+        related = "Related messages from the user's earlier chats:\n" + "\n".join(
+            f"- {truncate_to_tokens(message.content, RELATED_MESSAGE_TOKENS)}" for message in ctx["related"]
+        ) + "\n\n"
+
+    return (
+        f"I conducted an academic search for user '{ctx['user_id']}' with the query '{ctx['resolved_query']}'. "
         f"Here are the top results:\n"
         f"{search_summary}\n\n"
+        f"{extracts}"
+        f"{related}"
         f"Please summarize these academic resources or provide recommendations."
     )
 
-    # Step 5: Use Ollama to process the results
-    ollama_response = query_openai(prompt)
-    if not ollama_response:
-        return "Failed to retrieve response from Ollama."
 
+def cache_namespace(ctx):
+    """
+    Semantic cache namespace for the prompt. Prompts carrying the user's own messages (related
+    messages from earlier chats, or a query inferred from the chat history) are cached per user
+    so that they are never served to someone else.
+    """
+    if ctx.get("related") or not ctx["query"]:
+        return f"academic:user:{ctx['user_id']}"
+    return "academic"
+
+
+def query_llm_stage(ctx):
+    """
+    Stage: use Ollama to process the results.
+    """
+    ollama_response = cached_query(ctx["prompt"], namespace=cache_namespace(ctx))  # Opt-in semantic cache
+    if not ollama_response:
+        raise StageFailed("Failed to retrieve response from Ollama.")
     return ollama_response
 
+
+def academic_stages(query, with_llm=True):
+    """
+    Build the academic pipeline stages. With an explicit query, the history read and the
+    search do not depend on each other and run concurrently; the search for related past
+    messages runs alongside the academic search and the page enrichment.
+    """
+    stages = [
+        Stage("history", fetch_history_context, timeout=STAGE_TIMEOUTS["history"]),
+        Stage("resolved_query", resolve_query, depends_on=() if query else ("history",)),
+        Stage("search", search_academic, depends_on=("resolved_query",), timeout=STAGE_TIMEOUTS["search"]),
+        Stage("related", find_related_messages, depends_on=("resolved_query",), timeout=STAGE_TIMEOUTS["related"],
+              optional=True, default=[]),
+    ]
+    if ENRICH_ENABLED:
+        stages.append(Stage("enrich", enrich_search_results, depends_on=("search",), timeout=STAGE_TIMEOUTS["enrich"],
+                            optional=True, default=[]))
+    prompt_inputs = ("search", "related", "enrich") if ENRICH_ENABLED else ("search", "related")
+    stages.append(Stage("prompt", build_prompt, depends_on=prompt_inputs))
+    if with_llm:
+        stages.append(Stage("llm", query_llm_stage, depends_on=("prompt",), timeout=STAGE_TIMEOUTS["llm"]))
+    return stages
+
+
+def build_academic_prompt(user_id, chat_id, query=None):
+    """
+    Run the history lookup and academic search, and build the prompt for the LLM.
+    :return: (prompt, cache namespace, None) on success, or (None, None, error message) on failure.
+    """
+    result = Pipeline("academic_prompt", academic_stages(query, with_llm=False)).run(
+        user_id=user_id, chat_id=chat_id, query=query
+    )
+    if result.error:
+        return None, None, result.error
+    return result["prompt"], cache_namespace(result.context), None
+
+
+def academic_search_agent(user_id, chat_id, query=None):
+    """
+    Agent interface for academic search using SearxNG, Ollama, and user-specific history.
+    """
+    print(f"Processing academic query for user {user_id}, chat ID {chat_id}.")
+
+    result = Pipeline("academic", academic_stages(query)).run(user_id=user_id, chat_id=chat_id, query=query)
+    if result.error:
+        return result.error
+    return result["llm"]
+
+
+def academic_search_agent_stream(user_id, chat_id, query=None, stats=None):
+    """
+    Streaming variant of academic_search_agent, yielding response chunks as they arrive.
+    :param stats: Optional dict filled with the LLM stream metrics (see stream_openai).
+    """
+    print(f"Processing academic query for user {user_id}, chat ID {chat_id}.")
+
+    prompt, namespace, error = build_academic_prompt(user_id, chat_id, query)
+    if error:
+        yield error
+        return
+
+    received = False
+    for chunk in cached_stream(prompt, namespace=namespace, stats={} if stats is None else stats):
+        received = True
+        yield chunk
+    if not received:
+        yield "Failed to retrieve response from Ollama."
@@ -1,36 +1,50 @@
-from helper.searxng import VideoSearch
-from database.db import get_chat_history
+from agents.pipeline import Pipeline, Stage, StageFailed
+from agents.GoogleSearch import fetch_history_context, resolve_query
+from helper.searxng import video_search
 
-def video_search_agent(user_id, chat_id, query=None):
+# Per-stage timeouts in seconds
+STAGE_TIMEOUTS = {
+    "history": 5,
+    "search": 15,
+}
+
+
+def search_videos(ctx):
     """
-    Agent interface for video search using the VideoSearch class.
+    Stage: perform a video search with the shared VideoSearch client.
     """
-    print(f"Processing video search query for user {user_id}, chat ID {chat_id}.")
+    search_results = video_search.search(ctx["resolved_query"], engine="youtube")
+    if not search_results:
+        raise StageFailed("Failed to retrieve video search results.")
+    return search_results
 
-    # Step 1: Fetch chat history
-    chat_history = get_chat_history(user_id, chat_id)
-    if not chat_history:
-        print(f"No chat history found for user {user_id} and chat ID {chat_id}.")
-        context = "No prior context available."
-    else:
-        # Prepare a summary of the user's recent chat history
-        context = "\n".join([f"- {msg.content}" for msg in chat_history[-5:]])  # Last 5 messages
 
-    # Step 2: Use the provided query or infer search intent from chat history
-    if not query:
-        query = f"Based on the chat history:\n{context}\nWhat should I search for?"
+def format_video(result):
+    """
+    One line per video: title, URL, then channel and duration when known.
+    """
+    details = ", ".join(filter(None, [result.channel, result.duration]))
+    return f"{result.title}: {result.url}" + (f" ({details})" if details else "")
 
-    print(f"Inferred query: {query}")
 
-    # Step 3: Perform a video search using the VideoSearch class
-    video_search = VideoSearch()  # Initialize the VideoSearch instance
-    search_results = video_search.search(query, engine="youtube")
-    if not search_results:
-        return "Failed to retrieve video search results."
+def video_search_agent(user_id, chat_id, query=None):
+    """
+    Agent interface for video search using the shared VideoSearch client.
+    """
+    print(f"Processing video search query for user {user_id}, chat ID {chat_id}.")
+
+    # With an explicit query, the history read and the search run concurrently
+    pipeline_result = Pipeline("video", [
+        Stage("history", fetch_history_context, timeout=STAGE_TIMEOUTS["history"]),
+        Stage("resolved_query", resolve_query, depends_on=() if query else ("history",)),
+        Stage("search", search_videos, depends_on=("resolved_query",), timeout=STAGE_TIMEOUTS["search"]),
+    ]).run(user_id=user_id, chat_id=chat_id, query=query)
+    if pipeline_result.error:
+        return pipeline_result.error
 
-    # Step 4: Prepare and return a summary of video search results
+    # Prepare and return a summary of video search results
     video_summary = "\n".join(
-        [f"{idx + 1}. {result.get('title', 'No Title')}: {result.get('url', 'No URL')}" for idx, result in enumerate(search_results[:5])]
+        [f"{idx + 1}. {format_video(result)}" for idx, result in enumerate(pipeline_result["search"][:5])]
     )
 
     return f"Here are the top video results for your query:\n{video_summary}"
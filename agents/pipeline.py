@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from helper.metrics import profile_slow, record_stage_timings
+
+PRINT_STAGE_TIMINGS = os.getenv("PRINT_STAGE_TIMINGS", "").lower() in ("1", "true", "yes")
+
+# Callbacks notified with (pipeline name, {stage name: seconds}) after every run
+stage_timing_listeners = [record_stage_timings]
+
+
+class StageFailed(Exception):
+    """
+    Raised by a stage to stop its pipeline with a user-facing error message.
+    """
+
+
+class Stage:
+    def __init__(self, name, func, depends_on=(), timeout=None, optional=False, default=None):
+        """
+        A step of an agent pipeline.
+        :param name: Name of the stage; its return value is stored under this name.
+        :param func: Callable receiving the pipeline context dict (inputs and results of earlier stages).
+        :param depends_on: Names of the stages that must finish before this one starts.
+        :param timeout: Maximum seconds the stage may run once started, or None for no limit.
+        :param optional: The stage only adds context: when it fails or times out, its result is
+                         `default` and the run goes on instead of stopping with an error.
+        :param default: Result of an optional stage that failed or timed out.
+        """
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.timeout = timeout
+        self.optional = optional
+        self.default = default
+
+
+class PipelineResult:
+    def __init__(self, context, timings, error=None):
+        self.context = context
+        self.timings = timings
+        self.error = error
+
+    def __getitem__(self, name):
+        return self.context[name]
+
+
+class Pipeline:
+    def __init__(self, name, stages):
+        """
+        A set of stages run as soon as their dependencies are done, independent stages concurrently.
+        :param name: Pipeline name reported with the stage timings.
+        :param stages: List of Stage objects.
+        """
+        self.name = name
+        self.stages = list(stages)
+        names = {stage.name for stage in self.stages}
+        for stage in self.stages:
+            unknown = set(stage.depends_on) - names
+            if unknown:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stages {sorted(unknown)}")
+
+    def _timed(self, stage, context, started, timings):
+        # started and timings belong to the run, not the context, so a stage that outlives its
+        # timeout can still record itself after the run returned
+        started[stage.name] = time.monotonic()
+        start = time.perf_counter()
+        try:
+            # Profiled here, on the stage's own thread: a profiler only sees the thread it runs on
+            with profile_slow(f"stage-{self.name}-{stage.name}"):
+                return stage.func(context)
+        finally:
+            timings[stage.name] = time.perf_counter() - start
+
+    def run(self, **inputs):
+        """
+        Run the pipeline. Each run has its own threads, one per stage at most, so stages never
+        queue behind other runs, and a stage's timeout counts from when it starts. When a stage
+        fails or times out, stages that have not started are cancelled, stages already running
+        are signalled through context["cancelled"], and the run stops with the failure as its
+        error without waiting for them. An optional stage that fails or times out only gives its
+        default result.
+        :return: PipelineResult with the context (inputs and stage results), timings and error.
+        """
+        context = dict(inputs, cancelled=threading.Event())
+        started, timings = {}, {}
+        executor = ThreadPoolExecutor(max_workers=len(self.stages) or 1, thread_name_prefix=f"pipeline-{self.name}")
+        pending = list(self.stages)
+        running = {}  # future -> stage
+        done = set()
+        error = None
+
+        try:
+            while (pending or running) and error is None:
+                for stage in [stage for stage in pending if set(stage.depends_on) <= done]:
+                    pending.remove(stage)
+                    running[executor.submit(self._timed, stage, context, started, timings)] = stage
+                if not running:
+                    error = f"Stages {[stage.name for stage in pending]} have circular dependencies"
+                    break
+
+                # A stage that has not started yet cannot time out before `now + timeout`
+                now = time.monotonic()
+                deadlines = [
+                    started.get(stage.name, now) + stage.timeout
+                    for stage in running.values() if stage.timeout is not None
+                ]
+                timeout = max(0.0, min(deadlines) - now) if deadlines else None
+                finished, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in finished:
+                    stage = running.pop(future)
+                    try:
+                        context[stage.name] = future.result()
+                        done.add(stage.name)
+                    except Exception as e:
+                        if stage.optional:
+                            print(f"Optional stage '{stage.name}' failed, continuing without it: {e}")
+                            context[stage.name] = stage.default
+                            done.add(stage.name)
+                        elif isinstance(e, StageFailed):
+                            error = str(e)
+                        else:
+                            error = f"Stage '{stage.name}' failed: {e}"
+
+                now = time.monotonic()
+                for future, stage in list(running.items()):
+                    started_at = started.get(stage.name)
+                    if (error is None and stage.timeout is not None and started_at is not None
+                            and now >= started_at + stage.timeout and not future.done()):
+                        timings[stage.name] = stage.timeout
+                        if stage.optional:
+                            # Left running on its thread; later stages go on with the default
+                            print(f"Optional stage '{stage.name}' timed out after {stage.timeout}s, "
+                                  f"continuing without it")
+                            running.pop(future)
+                            context[stage.name] = stage.default
+                            done.add(stage.name)
+                        else:
+                            error = f"Stage '{stage.name}' timed out after {stage.timeout}s"
+        finally:
+            if error is not None:
+                context["cancelled"].set()
+            # Stages still running finish on their own threads; the run does not wait for them
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        timings = dict(timings)
+        for listener in stage_timing_listeners:
+            listener(self.name, dict(timings))
+        if PRINT_STAGE_TIMINGS:
+            summary = ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in timings.items())
+            print(f"Stage timings for {self.name}: {summary}")
+        return PipelineResult(context, timings, error)
@@ -0,0 +1,124 @@
+"""
+Benchmark the search result enrichment stage against local static file servers.
+
+Generates large HTML result pages (scripts, navigation and long bodies), serves them from
+several local servers standing in for different hosts, and compares a naive sequential
+fetch-and-parse of every full page with enrich_results (concurrent, per-host limits,
+stream-parsed and truncated, reranked in one batch), cold and with a warm page cache.
+
+Usage: python -m benchmarks.enrichment_benchmark [--pages 8] [--hosts 4] [--page-kb 800]
+           [--latency 0.2] [--runs 5]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import requests
+
+from benchmarks.fakes import StaticFileServer
+from helper import enrichment
+from helper.enrichment import TextExtractor, enrich_results, overlap_scores, split_passages
+
+TOPICS = ["retrieval augmented generation", "protein folding", "graph neural networks", "climate models"]
+
+
+def write_pages(directory, count, page_kb):
+    """
+    Write `count` HTML pages of about page_kb KB, each about one topic.
+    """
+    paragraph = "<p>{topic} is discussed in this section with results, methods and evaluation details.</p>\n"
+    names = []
+    for index in range(count):
+        topic = TOPICS[index % len(TOPICS)]
+        body = paragraph.format(topic=topic) * max(1, page_kb * 1024 // len(paragraph))
+        html = (
+            f"<html><head><title>{topic}</title><script>var tracking = '{'x' * 4096}';</script>"
+            f"<style>body {{ color: black; }}</style></head><body><nav>Home | About | Papers</nav>"
+            f"<h1>{topic.title()}</h1>{body}<footer>Copyright</footer></body></html>"
+        )
+        name = f"page_{index}.html"
+        with open(os.path.join(directory, name), "w") as file:
+            file.write(html)
+        names.append((name, topic))
+    return names
+
+
+def naive_enrich(query, results):
+    """
+    Baseline: download every full page one after the other, parse it, rank passages by word overlap.
+    """
+    passages = []
+    for result in results:
+        extractor = TextExtractor(max_chars=10 ** 9)
+        extractor.feed(requests.get(result["url"], timeout=30).text)
+        passages.extend(split_passages(extractor.text()))
+    scores = overlap_scores(query, passages)
+    return [passages[i] for i in np.argsort(-scores)[:5]]
+
+
+def time_runs(function, runs):
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.median(latencies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=8, help="Result pages per search")
+    parser.add_argument("--hosts", type=int, default=4, help="Local servers the pages are spread over")
+    parser.add_argument("--page-kb", type=int, default=800, help="Size of each page in KB")
+    parser.add_argument("--latency", type=float, default=0.2, help="Server latency per page in seconds")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    enrichment.ENRICH_ALLOW_PRIVATE = True  # The pages are served from 127.0.0.1
+
+    with tempfile.TemporaryDirectory() as directory:
+        pages = write_pages(directory, args.pages, args.page_kb)
+        servers = [StaticFileServer(directory, latency=args.latency).start() for _ in range(args.hosts)]
+        try:
+            results = [
+                {"title": topic, "url": f"{servers[index % len(servers)].url}/{name}", "content": f"About {topic}."}
+                for index, (name, topic) in enumerate(pages)
+            ]
+            query = "graph neural networks evaluation"
+            # Word overlap keeps the benchmark independent of the embedding model
+            encode = None if os.getenv("BENCHMARK_EMBEDDINGS") else (lambda texts: _overlap_encode(query, texts))
+
+            naive_ms = time_runs(lambda: naive_enrich(query, results), args.runs)
+
+            def cold():
+                enrichment.page_cache.clear()
+                return enrich_results(query, results, max_pages=len(results), encode=encode)
+
+            cold_ms = time_runs(cold, args.runs)
+            warm_ms = time_runs(lambda: enrich_results(query, results, max_pages=len(results), encode=encode),
+                                args.runs)
+            top = enrich_results(query, results, max_pages=len(results), encode=encode)
+        finally:
+            for server in servers:
+                server.stop()
+
+    print(f"{'pages':>6} {'hosts':>6} {'page KB':>8} {'naive ms':>10} {'cold ms':>9} {'warm ms':>9}")
+    print(f"{args.pages:>6} {args.hosts:>6} {args.page_kb:>8} {naive_ms:>10.1f} {cold_ms:>9.1f} {warm_ms:>9.1f}")
+    print("Top passage:", top[0]["title"], "-", top[0]["text"][:80] if top else None)
+
+
+def _overlap_encode(query, texts):
+    """
+    Vectors whose cosine with the first row follows the word overlap with the query.
+    """
+    scores = overlap_scores(query, texts[1:])
+    vectors = np.zeros((len(texts), 2), dtype=np.float32)
+    vectors[0] = [1.0, 0.0]
+    vectors[1:, 0] = scores
+    vectors[1:, 1] = 1.0 - scores
+    return vectors
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Local stand-ins for SearxNG, the LLM backends and result pages, with configurable latency.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _FakeServer:
+    handler = None
+
+    def __init__(self, latency=0.0, host="127.0.0.1", port=0):
+        """
+        :param latency: Seconds each request waits before responding.
+        """
+        handler = type("Handler", (self.handler,), {"fake": self})
+        self.latency = latency
+        self.requests = 0
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Headers and body are separate writes on keep-alive connections
+    fake = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload, content_type="application/json"):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _wait(self):
+        self.fake.requests += 1
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+
+
+class _SearxngHandler(_Handler):
+    def do_GET(self):
+        self._wait()
+        params = parse_qs(urlparse(self.path).query)
+        query = params.get("q", [""])[0]
+        engine = params.get("engines", ["google"])[0]
+        self._send({"query": query, "results": self.fake.make_results(query, engine)})
+
+
+class FakeSearxngServer(_FakeServer):
+    """
+    Serves canned SearxNG JSON responses.
+    """
+    handler = _SearxngHandler
+
+    def __init__(self, latency=0.0, results_per_query=10, **kwargs):
+        super().__init__(latency, **kwargs)
+        self.results_per_query = results_per_query
+
+    def make_results(self, query, engine):
+        return [
+            {
+                "title": f"{engine} result {index} for {query}",
+                "url": f"https://example.org/{engine.replace(' ', '_')}/{index}",
+                "content": f"Snippet {index} about {query}. " * 5,
+                "engines": [engine],
+            }
+            for index in range(self.results_per_query)
+        ]
+
+
+class _LLMHandler(_Handler):
+    def do_POST(self):
+        body = self._read_json()
+        self._wait()
+        completion = self.fake.completion
+        if self.path.endswith("/chat/completions"):
+            self._openai(body, completion)
+        elif self.path == "/api/chat":
+            self._ollama(body, completion)
+        else:  # /api/generate model preload
+            self._send({"done": True})
+
+    def _openai(self, body, completion):
+        if not body.get("stream"):
+            self._send({"choices": [{"index": 0, "message": {"role": "assistant", "content": completion}}]})
+            return
+        chunks = [
+            "data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": token}}]}) + "\n\n"
+            for token in self.fake.tokens()
+        ]
+        self._send(("".join(chunks) + "data: [DONE]\n\n").encode(), "text/event-stream")
+
+    def _ollama(self, body, completion):
+        if not body.get("stream"):
+            self._send({"message": {"role": "assistant", "content": completion}, "done": True})
+            return
+        lines = [json.dumps({"message": {"content": token}, "done": False}) for token in self.fake.tokens()]
+        lines.append(json.dumps({"message": {"content": ""}, "done": True}))
+        self._send(("\n".join(lines) + "\n").encode(), "application/x-ndjson")
+
+
+class FakeLLMServer(_FakeServer):
+    """
+    Serves a fixed completion over the OpenAI chat completion and Ollama chat APIs.
+    """
+    handler = _LLMHandler
+
+    def __init__(self, latency=0.0, completion="This is a canned summary of the search results.", **kwargs):
+        super().__init__(latency, **kwargs)
+        self.completion = completion
+
+    def tokens(self):
+        words = self.completion.split(" ")
+        return [word if index == 0 else f" {word}" for index, word in enumerate(words)]
+
+
+class _StaticFileHandler(SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    fake = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=self.fake.directory, **kwargs)
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        self.fake.requests += 1
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+        return super().send_head()
+
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        except (BrokenPipeError, ConnectionResetError):
+            # Clients stop reading once they extracted enough text
+            self.close_connection = True
+
+
+class StaticFileServer(_FakeServer):
+    """
+    Serves the files of a directory, e.g. generated result pages.
+    """
+    handler = _StaticFileHandler
+
+    def __init__(self, directory, latency=0.0, **kwargs):
+        self.directory = directory
+        super().__init__(latency, **kwargs)
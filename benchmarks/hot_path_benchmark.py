@@ -0,0 +1,218 @@
+"""
+Benchmark the chat turn hot path against synthetic user databases and local fake servers.
+
+Drives the database helpers, fetch_all_contexts and both agents at several history sizes,
+with SearxNG and the LLM replaced by local fake HTTP servers. Results are written as JSON
+so runs can be compared; --compare flags regressions against an earlier result file.
+
+Usage: python -m benchmarks.hot_path_benchmark [--sizes 10 1000 100000] [--iterations 50]
+           [--search-latency 0.05] [--llm-latency 0.2] [--compare benchmarks/results/<run>.json]
+           [--storage shared [--storage-url postgresql+psycopg2://...]]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fakes import FakeLLMServer, FakeSearxngServer
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+MESSAGES_PER_CHAT = 100
+INSERT_CHUNK = 10000
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def populate_user(db, user_id, size):
+    """
+    Fill a user's database with `size` synthetic messages spread over chats of MESSAGES_PER_CHAT.
+    """
+    storage = db.get_storage_backend()
+    rows = (
+        {
+            "chatId": f"chat_{index // MESSAGES_PER_CHAT}",
+            "messageId": f"msg_{index}",
+            "content": f"Synthetic message {index} about transformers, retrieval and evaluation.",
+            "role": "user" if index % 2 == 0 else "assistant",
+            "metadata": None,
+        }
+        for index in range(size)
+    )
+    with storage.engine(user_id).begin() as connection:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == INSERT_CHUNK:
+                connection.execute(storage.messages.insert(), storage.with_user(user_id, chunk))
+                chunk = []
+        if chunk:
+            connection.execute(storage.messages.insert(), storage.with_user(user_id, chunk))
+
+
+def measure(func, iterations):
+    """
+    Call func() `iterations` times with its output silenced.
+    :return: Latency percentiles (ms), throughput (ops/s) and peak RSS (MB).
+    """
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            call_start = time.perf_counter()
+            func()
+            latencies.append(time.perf_counter() - call_start)
+        elapsed = time.perf_counter() - start
+    return {
+        "iterations": iterations,
+        "throughput": iterations / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_benchmarks(args):
+    from database import db
+    from agents.GoogleSearch import academic_search_agent
+    from agents.VideoSearch import video_search_agent
+    from main import fetch_all_contexts
+
+    results = {}
+    for size in args.sizes:
+        user_id = f"bench_{size}"
+        populate_user(db, user_id, size)
+        chat_id = "chat_0"
+        counter = iter(range(10 ** 9))
+
+        scenarios = {
+            "db.add_message": lambda: db.add_message(
+                user_id, "bench_writes", f"write_{next(counter)}", "Benchmark write", "user"
+            ),
+            "db.get_recent_messages": lambda: db.get_recent_messages(user_id, chat_id, limit=5),
+            "db.get_chat_history": lambda: db.get_chat_history(user_id, chat_id),
+            "fetch_all_contexts": lambda: list(fetch_all_contexts(user_id)),
+            "academic_search_agent": lambda: academic_search_agent(user_id, chat_id, "retrieval augmented generation"),
+            "video_search_agent": lambda: video_search_agent(user_id, chat_id, "retrieval augmented generation"),
+        }
+        for name, func in scenarios.items():
+            if args.only and name not in args.only:
+                continue
+            result = measure(func, args.iterations)
+            results[f"{name}@{size}"] = result
+            print(
+                f"{name:<24} {size:>8} {result['throughput']:>10.1f} {result['p50_ms']:>9.2f} "
+                f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['peak_rss_mb']:>9.1f}"
+            )
+    return results
+
+
+def compare(results, baseline_path, tolerance, noise_ms):
+    """
+    Print regressions of p95 latency and throughput against a baseline result file.
+    :return: Number of regressions found.
+    """
+    with open(baseline_path) as file:
+        baseline = json.load(file)["results"]
+
+    regressions = 0
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        slower = result["p95_ms"] > base["p95_ms"] * (1 + tolerance) and result["p95_ms"] - base["p95_ms"] > noise_ms
+        lower_throughput = result["throughput"] < base["throughput"] * (1 - tolerance)
+        if slower or lower_throughput:
+            regressions += 1
+            print(
+                f"REGRESSION {key}: p95 {base['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms, "
+                f"throughput {base['throughput']:.1f} -> {result['throughput']:.1f} ops/s"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--only", nargs="+", help="Run only these scenarios")
+    parser.add_argument("--search-latency", type=float, default=0.05, help="Fake SearxNG latency in seconds")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake LLM latency in seconds")
+    parser.add_argument("--storage", choices=["per_user", "shared"], default="per_user", help="Storage layout")
+    parser.add_argument("--storage-url", help="Shared database URL (default: SQLite file in a temporary directory)")
+    parser.add_argument("--with-cache", action="store_true", help="Keep the search result cache enabled")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<timestamp>-<commit>.json)")
+    parser.add_argument("--compare", help="Baseline result file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown")
+    parser.add_argument("--noise-ms", type=float, default=1.0, help="Ignore p95 increases smaller than this")
+    args = parser.parse_args()
+
+    with FakeSearxngServer(latency=args.search_latency) as searxng, FakeLLMServer(latency=args.llm_latency) as llm, \
+            tempfile.TemporaryDirectory() as temp_dir:
+        # Configure the project before it is imported
+        os.environ.update({
+            "SEARXNG": searxng.url,
+            "LLM_BACKEND": "ollama",
+            "OLLAMA": llm.url,
+        })
+        if not args.with_cache:
+            os.environ["SEARCH_CACHE_TTL"] = "0"
+        from database import db
+        db.BASE_DB_DIR = temp_dir
+        if args.storage == "shared":
+            db.set_storage_backend(db.SharedStorage(args.storage_url or f"sqlite:///{temp_dir}/shared.db"))
+
+        print(f"{'scenario':<24} {'messages':>8} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rss MB':>9}")
+        results = run_benchmarks(args)
+
+    commit = git_commit()
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit or 'unknown'}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as file:
+        json.dump({
+            "meta": {
+                "commit": commit,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "args": vars(args),
+            },
+            "results": results,
+        }, file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare and compare(results, args.compare, args.tolerance, args.noise_ms):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
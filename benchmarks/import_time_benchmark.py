@@ -0,0 +1,76 @@
+"""
+Guard the startup latency of main.py using `python -X importtime`.
+
+Fails (exit code 1) when importing the target exceeds the time budget or pulls in
+a heavy module that must only be loaded on first use.
+
+Usage: python -m benchmarks.import_time_benchmark [--module main] [--budget-ms 1500] [--runs 3]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Modules that must stay lazy (loaded by helper.lazy singletons on first use)
+HEAVY_MODULES = ("sentence_transformers", "torch", "transformers", "sklearn", "faiss", "openai")
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module):
+    """
+    Import a module in a fresh interpreter.
+    :return: (total cumulative microseconds, {module name: cumulative microseconds})
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    cumulative = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        _, cumulative_us, indent, name = match.groups()
+        cumulative[name] = int(cumulative_us)
+        if len(indent) == 1:  # Top-level import
+            total += int(cumulative_us)
+    return total, cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=1500.0)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.runs)]
+    best_total, cumulative = min(runs, key=lambda run: run[0])
+
+    print(f"Import of '{args.module}': best {best_total / 1000:.1f} ms over {args.runs} runs")
+    for name, microseconds in sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {microseconds / 1000:>8.1f} ms  {name}")
+
+    failures = []
+    if best_total / 1000 > args.budget_ms:
+        failures.append(f"import time {best_total / 1000:.1f} ms exceeds budget {args.budget_ms:.1f} ms")
+    eager = sorted({name.split(".")[0] for name in cumulative} & set(HEAVY_MODULES))
+    if eager:
+        failures.append(f"heavy modules imported eagerly: {', '.join(eager)}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
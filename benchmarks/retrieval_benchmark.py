@@ -0,0 +1,149 @@
+"""
+Compare hybrid retrieval (FTS5 BM25 + vector index, fused by reciprocal rank) with a full scan.
+
+The full scan is what retrieval costs without indexes: a LIKE scan of every message for the
+query words plus brute-force cosine similarity against every embedding, fused the same way.
+Messages are synthetic sentences; embeddings are a deterministic bag-of-words projection, so
+the benchmark needs neither the embedding model nor network access.
+
+Usage: python -m benchmarks.retrieval_benchmark [--sizes 10000 100000] [--queries 50]
+"""
+import argparse
+import re
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import or_, select
+
+from database import db
+from helper.retrieval import HYBRID_CANDIDATES, hybrid_search, reciprocal_rank_fusion
+from helper.vector_index import EMBEDDING_DIM, get_user_index
+
+VOCABULARY_SIZE = 5000
+WORDS_PER_MESSAGE = 12
+INSERT_CHUNK = 10000
+
+
+class BagOfWordsEncoder:
+    """
+    Deterministic stand-in for the embedding model: the normalized sum of fixed random word vectors.
+    """
+
+    def __init__(self, vocabulary, dim=EMBEDDING_DIM, seed=0):
+        rng = np.random.default_rng(seed)
+        self.index = {word: position for position, word in enumerate(vocabulary)}
+        self.vectors = rng.standard_normal((len(vocabulary), dim), dtype=np.float32)
+
+    def __call__(self, text):
+        positions = [self.index[word] for word in re.findall(r"\w+", text.lower()) if word in self.index]
+        vector = self.vectors[positions].sum(axis=0) if positions else np.zeros(self.vectors.shape[1], np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+def make_messages(size, vocabulary, rng):
+    # Zipf-distributed words, like natural text
+    weights = 1.0 / np.arange(1, len(vocabulary) + 1)
+    weights /= weights.sum()
+    words = rng.choice(len(vocabulary), size=(size, WORDS_PER_MESSAGE), p=weights)
+    return [" ".join(vocabulary[word] for word in row) for row in words]
+
+
+def populate(user_id, contents, encoder):
+    """
+    Store the messages (the FTS5 triggers index them) and add their embeddings to the vector index.
+    :return: Matrix of all embeddings, rows in message id order.
+    """
+    storage = db.get_storage_backend()
+    ids = []
+    with storage.engine(user_id).begin() as connection:
+        insert = storage.messages.insert().returning(storage.messages.c.id, sort_by_parameter_order=True)
+        for start in range(0, len(contents), INSERT_CHUNK):
+            rows = [
+                {"chatId": f"chat_{(start + offset) // 100}", "messageId": f"msg_{start + offset}",
+                 "content": content, "role": "user", "metadata": None}
+                for offset, content in enumerate(contents[start:start + INSERT_CHUNK])
+            ]
+            ids.extend(connection.execute(insert, storage.with_user(user_id, rows)).scalars().all())
+
+    matrix = np.stack([encoder(content) for content in contents])
+    get_user_index(user_id).add(ids, matrix)
+    return np.asarray(ids), matrix
+
+
+def full_scan_search(user_id, query, ids, matrix, encoder, top_k=5, candidates=HYBRID_CANDIDATES):
+    """
+    Retrieval without indexes: LIKE scan for the query words and brute-force cosine similarity.
+    """
+    storage = db.get_storage_backend()
+    table = storage.messages
+    terms = set(re.findall(r"\w+", query.lower()))
+    session = db.get_user_session(user_id)
+    try:
+        rows = session.execute(
+            select(table.c.id, table.c.content)
+            .where(or_(*[table.c.content.like(f"%{term}%") for term in terms]), *storage.user_filter(table, user_id))
+        ).fetchall()
+    finally:
+        session.close()
+    # Rank keyword hits by how many query words they contain
+    lexical = sorted(rows, key=lambda row: -len(terms & set(row.content.lower().split())))
+    scores = matrix @ encoder(query)
+    semantic = ids[np.argsort(-scores)[:candidates]]
+    fused = reciprocal_rank_fusion([[row.id for row in lexical[:candidates]], semantic.tolist()])
+    return db.get_messages_by_ids(user_id, fused[:top_k])
+
+
+def time_queries(function, queries):
+    """
+    Return the p50 and mean latency of function(query) in milliseconds.
+    """
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        function(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.median(latencies)), float(np.mean(latencies))
+
+
+def run(size, num_queries):
+    rng = np.random.default_rng(size)
+    vocabulary = [f"w{index}" for index in range(VOCABULARY_SIZE)]
+    encoder = BagOfWordsEncoder(vocabulary)
+    user_id = f"bench_retrieval_{size}"
+
+    start = time.perf_counter()
+    ids, matrix = populate(user_id, make_messages(size, vocabulary, rng), encoder)
+    populate_s = time.perf_counter() - start
+
+    queries = [" ".join(vocabulary[word] for word in rng.integers(20, 2000, 3)) for _ in range(num_queries)]
+    result = {"size": size, "populate_s": populate_s}
+    result["hybrid_p50_ms"], result["hybrid_mean_ms"] = time_queries(
+        lambda query: hybrid_search(user_id, query, encode=encoder), queries
+    )
+    result["scan_p50_ms"], result["scan_mean_ms"] = time_queries(
+        lambda query: full_scan_search(user_id, query, ids, matrix, encoder), queries
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db.BASE_DB_DIR = temp_dir  # Keep benchmark databases and indexes out of the real directory
+        print(f"{'size':>10} {'populate s':>11} {'hybrid p50':>11} {'hybrid mean':>12} {'scan p50':>9} {'scan mean':>10}")
+        for size in args.sizes:
+            result = run(size, args.queries)
+            print(
+                f"{size:>10} {result['populate_s']:>11.1f} {result['hybrid_p50_ms']:>11.2f} "
+                f"{result['hybrid_mean_ms']:>12.2f} {result['scan_p50_ms']:>9.2f} {result['scan_mean_ms']:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
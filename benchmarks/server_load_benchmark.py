@@ -0,0 +1,88 @@
+"""
+Load-test a running chat server and report turn latency percentiles at increasing concurrency.
+
+Start the server first (python server.py), then:
+Usage: python -m benchmarks.server_load_benchmark [--url http://127.0.0.1:8000] [--levels 1 4 16 64] [--turns 20]
+"""
+import argparse
+import asyncio
+import time
+
+import aiohttp
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a list of values.
+    """
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def open_session(http, url, username, password):
+    """
+    Log a load-test user in, creating the account on first use.
+    """
+    async with http.post(f"{url}/login", json={"username": username, "password": password}) as response:
+        if response.status == 200:
+            return (await response.json())["token"]
+    async with http.post(f"{url}/signup", json={"username": username, "password": password}) as response:
+        response.raise_for_status()
+        return (await response.json())["token"]
+
+
+async def run_user(http, url, token, agent, turns, latencies, errors):
+    """
+    Send turns sequentially for one user, recording the client-side latency of each.
+    """
+    headers = {"Authorization": f"Bearer {token}"}
+    for turn in range(turns):
+        payload = {"chat_id": "loadtest_chat", "agent": agent, "message": f"load test query {turn}"}
+        start = time.perf_counter()
+        async with http.post(f"{url}/chat", json=payload, headers=headers) as response:
+            await response.read()
+            if response.status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(response.status)
+
+
+async def run_level(url, concurrency, turns, agent):
+    latencies, errors = [], []
+    connector = aiohttp.TCPConnector(limit=concurrency * 2)
+    async with aiohttp.ClientSession(connector=connector) as http:
+        tokens = await asyncio.gather(*(
+            open_session(http, url, f"loadtest_user_{index}", "loadtest") for index in range(concurrency)
+        ))
+        start = time.perf_counter()
+        await asyncio.gather(*(run_user(http, url, token, agent, turns, latencies, errors) for token in tokens))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+async def main_async(args):
+    print(f"{'users':>6} {'turns':>6} {'errors':>7} {'turns/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for concurrency in args.levels:
+        latencies, errors, elapsed = await run_level(args.url, concurrency, args.turns, args.agent)
+        if not latencies:
+            print(f"{concurrency:>6} {0:>6} {len(errors):>7}")
+            continue
+        print(
+            f"{concurrency:>6} {len(latencies):>6} {len(errors):>7} {len(latencies) / elapsed:>8.1f} "
+            f"{percentile(latencies, 0.50) * 1000:>8.1f} {percentile(latencies, 0.95) * 1000:>8.1f} "
+            f"{percentile(latencies, 0.99) * 1000:>8.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--turns", type=int, default=20, help="Turns per user at each level")
+    parser.add_argument("--agent", default="video")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
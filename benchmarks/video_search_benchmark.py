@@ -0,0 +1,134 @@
+"""
+Benchmark parsing of large SearXNG video responses.
+
+Builds canned JSON payloads shaped like SearXNG video results (thumbnails, iframes, snippets,
+engine metadata, YouTube URLs in several forms with duplicates) and compares:
+- full: json.loads of the whole payload, keeping the result dicts (the previous behaviour),
+- stream: incremental parse of every result into compact VideoResult records, de-duplicated,
+- stream@N: incremental parse that stops once N unique results were found.
+Memory is the tracemalloc peak while parsing and the size retained by the returned results.
+
+Usage: python -m benchmarks.video_search_benchmark [--results 200 2000 20000] [--limit 5] [--runs 5]
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from helper.searxng import iter_video_results
+
+CHUNK_SIZE = 16384
+URL_FORMS = [
+    "https://www.youtube.com/watch?v={id}",
+    "https://m.youtube.com/watch?v={id}&t=42s",
+    "https://youtu.be/{id}",
+    "https://www.youtube.com/embed/{id}",
+    "https://www.youtube.com/shorts/{id}",
+]
+
+
+def make_payload(count, seed=0):
+    """
+    SearXNG-like JSON response with `count` video results, about a third of them duplicates.
+    """
+    rng = random.Random(seed)
+    video_ids = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-")
+                         for _ in range(11)) for _ in range(max(1, count * 2 // 3))]
+    results = []
+    for index in range(count):
+        video_id = rng.choice(video_ids)
+        results.append({
+            "url": rng.choice(URL_FORMS).format(id=video_id),
+            "title": f"Video {index} about retrieval augmented generation",
+            "content": "A long description of the video with timestamps and links. " * 6,
+            "author": f"Channel {index % 50}",
+            "length": f"{rng.randint(1, 59)}:{rng.randint(0, 59):02d}",
+            "thumbnail": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+            "iframe_src": f"https://www.youtube-nocookie.com/embed/{video_id}",
+            "publishedDate": "2024-05-01T12:00:00",
+            "engine": "youtube",
+            "engines": ["youtube"],
+            "parsed_url": ["https", "www.youtube.com", "/watch", "", f"v={video_id}", ""],
+            "template": "videos.html",
+            "positions": [index + 1],
+            "score": 1.0 / (index + 1),
+            "category": "videos",
+        })
+    return json.dumps({
+        "query": "retrieval augmented generation",
+        "number_of_results": count,
+        "results": results,
+        "answers": [],
+        "corrections": [],
+        "infoboxes": [],
+        "suggestions": ["rag tutorial", "rag explained"],
+        "unresponsive_engines": [],
+    }).encode()
+
+
+def chunks(payload):
+    view = memoryview(payload)
+    for start in range(0, len(payload), CHUNK_SIZE):
+        yield bytes(view[start:start + CHUNK_SIZE])
+
+
+def parse_full(payload):
+    return json.loads(payload).get("results", [])
+
+
+def parse_stream(payload, limit=None):
+    results, seen = [], set()
+    for result in iter_video_results(chunks(payload)):
+        if result.url in seen:
+            continue
+        seen.add(result.url)
+        results.append(result)
+        if limit and len(results) >= limit:
+            break
+    return results
+
+
+def measure(function, payload, runs):
+    """
+    Median parse time in ms, tracemalloc peak in KB and KB retained by the returned results.
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(payload)
+        timings.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    results = function(payload)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    timings.sort()
+    return timings[len(timings) // 2], (peak - baseline) / 1024, (retained - baseline) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--results", type=int, nargs="+", default=[200, 2000, 20000], help="Results per payload")
+    parser.add_argument("--limit", type=int, default=5, help="Unique results wanted by the early-stop parse")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'results':>8} {'payload KB':>11} {'parser':>10} {'parse ms':>9} {'peak KB':>9} {'retained KB':>12} {'kept':>6}")
+    for count in args.results:
+        payload = make_payload(count)
+        parsers = {
+            "full": parse_full,
+            "stream": parse_stream,
+            f"stream@{args.limit}": lambda data: parse_stream(data, args.limit),
+        }
+        for name, function in parsers.items():
+            parse_ms, peak_kb, retained_kb = measure(function, payload, args.runs)
+            kept = len(function(payload))
+            print(f"{count:>8} {len(payload) / 1024:>11.0f} {name:>10} {parse_ms:>9.2f} {peak_kb:>9.0f} "
+                  f"{retained_kb:>12.1f} {kept:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+import bcrypt
+from sqlalchemy import Table, Column, MetaData, Text, create_engine, event, select
+from sqlalchemy.dialects.sqlite import insert
+
+# SQLite file holding the user credentials, and the JSON file it replaces
+CREDENTIALS_DB = os.getenv("CREDENTIALS_DB", "database/credentials.db")
+LEGACY_CREDENTIALS_FILE = "database/credentials.json"
+
+# bcrypt cost factor for new hashes; stored hashes with another cost are rehashed on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Recent successful verifications kept in memory so repeat logins skip bcrypt
+CREDENTIAL_CACHE_TTL = float(os.getenv("CREDENTIAL_CACHE_TTL", "300"))  # Seconds, 0 disables the cache
+CREDENTIAL_CACHE_MAX_ENTRIES = int(os.getenv("CREDENTIAL_CACHE_MAX_ENTRIES", "1024"))
+
+credentials_metadata = MetaData()
+
+# The primary key doubles as the username lookup index
+users = Table(
+    'users',
+    credentials_metadata,
+    Column('username', Text, primary_key=True),
+    Column('passwordHash', Text, nullable=False),
+    Column('createdAt', Text, nullable=False),
+    Column('updatedAt', Text, nullable=False),
+)
+
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+    finally:
+        cursor.close()
+
+
+def bcrypt_rounds(password_hash):
+    """
+    Cost factor of a bcrypt hash ("$2b$12$..." -> 12).
+    """
+    try:
+        return int(password_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class CredentialStore:
+    def __init__(self, path=CREDENTIALS_DB, rounds=BCRYPT_ROUNDS, cache_ttl=CREDENTIAL_CACHE_TTL,
+                 cache_max_entries=CREDENTIAL_CACHE_MAX_ENTRIES, legacy_file=LEGACY_CREDENTIALS_FILE):
+        """
+        Initialize a credential store backed by a SQLite table.
+        :param path: SQLite file of the store.
+        :param rounds: bcrypt cost factor used for new and rehashed passwords.
+        :param cache_ttl: Seconds a successful verification is remembered.
+        :param cache_max_entries: Maximum number of remembered verifications.
+        :param legacy_file: credentials.json imported into an empty store, if it exists.
+        """
+        self.path = path
+        self.rounds = rounds
+        self.cache_ttl = cache_ttl
+        self.cache_max_entries = cache_max_entries
+        self.legacy_file = legacy_file
+        self._engine = None
+        self._engine_lock = threading.Lock()
+        # (username, password digest) -> (expires_at, password hash verified against)
+        self._verified = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Key of the password digests, so the cache never holds anything reusable outside this process
+        self._digest_key = secrets.token_bytes(32)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.rehashed = 0
+
+    def _get_engine(self):
+        if self._engine is None:
+            with self._engine_lock:
+                if self._engine is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    engine = create_engine(f"sqlite:///{self.path}")
+                    event.listen(engine, "connect", _apply_pragmas)
+                    credentials_metadata.create_all(engine)
+                    self._import_legacy_file(engine)
+                    self._engine = engine
+        return self._engine
+
+    def _import_legacy_file(self, engine):
+        """
+        Copy the users of credentials.json into an empty store.
+        """
+        if not self.legacy_file or not os.path.exists(self.legacy_file):
+            return
+        with engine.begin() as connection:
+            if connection.execute(select(users.c.username).limit(1)).first() is not None:
+                return
+            with open(self.legacy_file, "r") as file:
+                legacy = json.load(file)
+            now = time.strftime("%Y-%m-%dT%H:%M:%S")
+            rows = [
+                {"username": username, "passwordHash": password_hash, "createdAt": now, "updatedAt": now}
+                for username, password_hash in legacy.items()
+            ]
+            if rows:
+                connection.execute(insert(users).on_conflict_do_nothing(), rows)
+                print(f"Imported {len(rows)} users from {self.legacy_file}")
+
+    def _get_hash(self, username):
+        with self._get_engine().connect() as connection:
+            return connection.execute(
+                select(users.c.passwordHash).where(users.c.username == username)
+            ).scalar()
+
+    def _hash(self, password):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.rounds)).decode('utf-8')
+
+    def _digest(self, username, password):
+        return hmac.new(self._digest_key, f"{username}\x1f{password}".encode('utf-8'), hashlib.sha256).digest()
+
+    def exists(self, username):
+        """
+        Check whether an account exists for a username.
+        """
+        return self._get_hash(username) is not None
+
+    def create(self, username, password):
+        """
+        Create an account in a single atomic insert.
+        :return: True if the account was created, False if the username is taken.
+        """
+        now = time.strftime("%Y-%m-%dT%H:%M:%S")
+        statement = insert(users).values(
+            username=username, passwordHash=self._hash(password), createdAt=now, updatedAt=now
+        ).on_conflict_do_nothing()
+        with self._get_engine().begin() as connection:
+            return connection.execute(statement).rowcount == 1
+
+    def set_password(self, username, password_hash):
+        """
+        Insert or update the stored hash of a user in a single atomic upsert.
+        """
+        now = time.strftime("%Y-%m-%dT%H:%M:%S")
+        statement = insert(users).values(
+            username=username, passwordHash=password_hash, createdAt=now, updatedAt=now
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[users.c.username],
+            set_={"passwordHash": statement.excluded.passwordHash, "updatedAt": statement.excluded.updatedAt},
+        )
+        with self._get_engine().begin() as connection:
+            connection.execute(statement)
+
+    def verify(self, username, password):
+        """
+        Check a username and password. Recently verified pairs are answered from memory as long
+        as the stored hash is unchanged; hashes with an outdated cost factor are rehashed.
+        """
+        stored_hash = self._get_hash(username)
+        if stored_hash is None:
+            return False
+
+        key = (username, self._digest(username, password))
+        now = time.monotonic()
+        with self._cache_lock:
+            entry = self._verified.get(key)
+            if entry is not None and entry[0] > now and entry[1] == stored_hash:
+                self._verified.move_to_end(key)
+                self.cache_hits += 1
+                return True
+            self.cache_misses += 1
+
+        if not bcrypt.checkpw(password.encode('utf-8'), stored_hash.encode('utf-8')):
+            return False
+
+        if bcrypt_rounds(stored_hash) != self.rounds:
+            stored_hash = self._hash(password)
+            self.set_password(username, stored_hash)
+            self.rehashed += 1
+
+        if self.cache_ttl > 0:
+            with self._cache_lock:
+                self._verified[key] = (now + self.cache_ttl, stored_hash)
+                self._verified.move_to_end(key)
+                while len(self._verified) > self.cache_max_entries:
+                    self._verified.popitem(last=False)
+        return True
+
+    def stats(self):
+        """
+        Return verification cache counters.
+        """
+        with self._cache_lock:
+            return {
+                "cached": len(self._verified),
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "rehashed": self.rehashed,
+            }
+
+
+# Shared store used by the account helpers in database/db.py
+credential_store = CredentialStore()
@@ -0,0 +1,351 @@
+"""
+Retention compaction of the per-user SQLite databases, with compressed JSON-lines archives.
+
+`compact` streams the old chats of each user into a gzip-compressed JSONL archive, deletes them
+in short batched transactions and returns the freed pages to the file system with incremental
+VACUUM. Users are processed in parallel by a process pool. `import` loads an archive back with
+bulk inserts. Both read rows in chunks, so memory stays constant however large a user is.
+
+A chat is old when it is not among the user's `--keep-chats` most recently active chats and,
+with `--older-than`, its chats row was created more than that many days ago. The chats row is
+created with a chat's first message; chats from before that have no age and are kept.
+
+Archive lines are {"type": "message", ...messages row} for every message of a chat, followed by
+{"type": "chat", ...chats row} when the chat has one. Embeddings are not archived; imported
+messages get new ids and are embedded again by the embedding backfill.
+
+Compaction also rebuilds the FAISS index of each user it changed. A running server notices the
+replaced index file and reloads it, but vectors it logs while the rebuild is running are dropped
+until the embeddings are rebuilt again, so compact while the server is stopped when possible.
+
+Usage: python -m database.maintenance compact [users ...] [--keep-chats 50] [--older-than 90]
+           [--archive-dir database/archives] [--workers 4] [--batch-size 2000]
+       python -m database.maintenance import <user> <archive.jsonl.gz> [...]
+"""
+import argparse
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, text
+
+from database import db
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "database/archives")
+COMPACT_BATCH_SIZE = 2000  # Rows read, written or deleted per batch
+CHAT_BATCH_SIZE = 500  # Chat ids per query, well below SQLite's bound parameter limit
+VACUUM_STEP_PAGES = 2000  # Pages freed per incremental_vacuum statement (8 MB with 4 KB pages)
+MESSAGE_COLUMNS = ("id", "chatId", "messageId", "content", "role", "metadata")
+
+
+def _chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def database_size(engine):
+    """
+    Size in bytes of a SQLite database file after checkpointing its write-ahead log.
+    """
+    with engine.connect() as connection:
+        connection.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        page_size = connection.execute(text("PRAGMA page_size")).scalar()
+        page_count = connection.execute(text("PRAGMA page_count")).scalar()
+    return page_size * page_count
+
+
+def find_old_chats(connection, keep_chats=50, older_than_days=None):
+    """
+    Ids of the chats to archive: all but the keep_chats most recently active ones (by last
+    message id), restricted to chats created more than older_than_days days ago if given.
+    Chats without a chats row have no known age, so they are never old by age.
+    """
+    last_message = func.max(db.messages.c.id).label("last_message")
+    query = select(db.messages.c.chatId, last_message).group_by(db.messages.c.chatId).order_by(last_message.desc())
+    old = [row.chatId for row in connection.execute(query.offset(keep_chats))]
+    if older_than_days is None or not old:
+        return old
+
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).strftime('%Y-%m-%dT%H:%M:%S')
+    created_before = set()
+    for chat_ids in _chunked(old, CHAT_BATCH_SIZE):
+        query = select(db.chats.c.id).where(db.chats.c.id.in_(chat_ids), db.chats.c.createdAt < cutoff)
+        created_before.update(connection.execute(query).scalars())
+    return [chat_id for chat_id in old if chat_id in created_before]
+
+
+def export_chats(engine, chat_ids, archive_path, batch_size=COMPACT_BATCH_SIZE):
+    """
+    Stream the messages and chats rows of chat_ids to a gzip-compressed JSONL archive.
+    The archive is written to a temporary file and renamed once complete.
+    :return: (messages exported, highest exported message id).
+    """
+    os.makedirs(os.path.dirname(archive_path) or ".", exist_ok=True)
+    temp_path = f"{archive_path}.partial"
+    exported, max_id = 0, 0
+    with gzip.open(temp_path, "wt", encoding="utf-8", compresslevel=6) as archive, engine.connect() as connection:
+        for chat_ids_batch in _chunked(chat_ids, CHAT_BATCH_SIZE):
+            chat_rows = {
+                row.id: row._asdict()
+                for row in connection.execute(select(db.chats).where(db.chats.c.id.in_(chat_ids_batch)))
+            }
+            query = (
+                select(*[db.messages.c[name] for name in MESSAGE_COLUMNS])
+                .where(db.messages.c.chatId.in_(chat_ids_batch))
+                .order_by(db.messages.c.chatId, db.messages.c.id)
+            )
+            result = connection.execution_options(stream_results=True).execute(query)
+            current_chat = None
+            while rows := result.fetchmany(batch_size):
+                lines = []
+                for row in rows:
+                    if current_chat is not None and row.chatId != current_chat and current_chat in chat_rows:
+                        lines.append(json.dumps(dict(chat_rows.pop(current_chat), type="chat")))
+                    current_chat = row.chatId
+                    lines.append(json.dumps(dict(row._asdict(), type="message")))
+                    max_id = max(max_id, row.id)
+                archive.write("\n".join(lines) + "\n")
+                exported += len(rows)
+            if current_chat in chat_rows:
+                archive.write(json.dumps(dict(chat_rows.pop(current_chat), type="chat")) + "\n")
+    os.replace(temp_path, archive_path)
+    return exported, max_id
+
+
+def delete_chats(engine, chat_ids, max_id, batch_size=COMPACT_BATCH_SIZE):
+    """
+    Delete the archived messages (ids up to max_id), their embeddings and the chats rows of
+    chat_ids, in transactions of at most batch_size messages so writers are never blocked long.
+    :return: Number of messages deleted.
+    """
+    messages, embeddings = db.messages, db.message_embeddings
+    deleted = 0
+    for chat_ids_batch in _chunked(chat_ids, CHAT_BATCH_SIZE):
+        while True:
+            with engine.begin() as connection:
+                ids = connection.execute(
+                    select(messages.c.id)
+                    .where(messages.c.chatId.in_(chat_ids_batch), messages.c.id <= max_id)
+                    .limit(batch_size)
+                ).scalars().all()
+                if not ids:
+                    connection.execute(db.chats.delete().where(db.chats.c.id.in_(chat_ids_batch)))
+                    break
+                connection.execute(embeddings.delete().where(embeddings.c.messageRowId.in_(ids)))
+                connection.execute(messages.delete().where(messages.c.id.in_(ids)))
+            deleted += len(ids)
+    return deleted
+
+
+def incremental_vacuum(engine, step_pages=VACUUM_STEP_PAGES):
+    """
+    Return the free pages of a database to the file system a few at a time.
+    A database created without auto_vacuum=INCREMENTAL is converted first by one full VACUUM.
+    """
+    with engine.connect() as connection:
+        connection.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('optimize')"))
+        connection.commit()
+        if connection.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+            connection.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+            connection.execute(text("VACUUM"))
+        while connection.execute(text("PRAGMA freelist_count")).scalar():
+            connection.execute(text(f"PRAGMA incremental_vacuum({step_pages})"))
+            connection.commit()
+
+
+def rebuild_vector_index(engine, user_id, batch_size=COMPACT_BATCH_SIZE):
+    """
+    Rebuild a user's FAISS index from the remaining stored embeddings, so it holds no vectors of
+    deleted messages (SQLite may hand their ids to new messages).
+    A running server reloads the rebuilt file instead of overwriting it, see UserVectorIndex.
+    """
+    try:
+        from helper.embedding_pipeline import blob_to_vector
+        from helper.vector_index import UserVectorIndex
+    except ImportError as e:
+        print(f"Skipping vector index of {user_id}, rebuild it with the embedding backfill: {e}")
+        return
+
+    index = UserVectorIndex(user_id, load=False)
+    if not os.path.exists(index.path) and not os.path.exists(index.log_path):
+        return
+    table = db.message_embeddings
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(
+            select(table.c.messageRowId, table.c.vector).order_by(table.c.messageRowId)
+        )
+        while rows := result.fetchmany(batch_size):
+            index.add([row.messageRowId for row in rows], [blob_to_vector(row.vector) for row in rows], persist=False)
+    # Written once, replacing the old index file and its log
+    index.save(force=True)
+
+
+def compact_user(user_id, base_dir=None, archive_dir=ARCHIVE_DIR, keep_chats=50, older_than_days=None,
+                 batch_size=COMPACT_BATCH_SIZE, dry_run=False):
+    """
+    Archive and delete a user's old chats, then vacuum the user's database.
+    Runs in a worker process, so it opens the database itself and returns plain statistics.
+    :return: Dict with the user, chats, messages, archive path and size, bytes before/after and seconds.
+    """
+    if base_dir is not None:
+        db.BASE_DB_DIR = base_dir
+    start = time.perf_counter()
+    engine, _ = db.engine_registry.get(user_id)
+    stats = {"user": user_id, "chats": 0, "messages": 0, "archive": None, "archive_bytes": 0}
+    try:
+        stats["bytes_before"] = database_size(engine)
+        with engine.connect() as connection:
+            chat_ids = find_old_chats(connection, keep_chats, older_than_days)
+        stats["chats"] = len(chat_ids)
+
+        if chat_ids and not dry_run:
+            archive_path = os.path.join(archive_dir, user_id, f"{datetime.now().strftime('%Y%m%dT%H%M%S')}.jsonl.gz")
+            exported, max_id = export_chats(engine, chat_ids, archive_path, batch_size)
+            stats.update(archive=archive_path, archive_bytes=os.path.getsize(archive_path))
+            stats["messages"] = delete_chats(engine, chat_ids, max_id, batch_size)
+            if stats["messages"] != exported:
+                print(f"Warning: {user_id}: exported {exported} messages but deleted {stats['messages']}")
+            incremental_vacuum(engine)
+            rebuild_vector_index(engine, user_id, batch_size)
+        stats["bytes_after"] = database_size(engine)
+    finally:
+        db.engine_registry.dispose(user_id)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def import_archive(user_id, archive_path, batch_size=COMPACT_BATCH_SIZE):
+    """
+    Load an archive written by compact back into a user's database with bulk inserts.
+    Messages get new ids; chats that already have messages in the database are skipped,
+    so importing an archive twice does not duplicate them.
+    :return: (messages imported, chats skipped).
+    """
+    engine, _ = db.engine_registry.get(user_id)
+    insert_messages = db.messages.insert().returning(db.messages.c.id, sort_by_parameter_order=True)
+    imported, skipped = 0, set()
+    with gzip.open(archive_path, "rt", encoding="utf-8") as archive, engine.begin() as connection:
+        pending = []  # Messages of the current chat not inserted yet
+        id_map = []  # (old id, new id) pairs of the current chat, in id order
+        current_chat = None
+
+        def flush():
+            nonlocal imported
+            if pending:
+                new_ids = connection.execute(
+                    insert_messages, [{k: v for k, v in row.items() if k != "id"} for row in pending]
+                ).scalars().all()
+                id_map.extend(zip((row["id"] for row in pending), new_ids))
+                imported += len(pending)
+                pending.clear()
+
+        for line in archive:
+            record = json.loads(line)
+            kind = record.pop("type")
+            if kind == "message":
+                if record["chatId"] != current_chat:
+                    flush()
+                    id_map.clear()
+                    current_chat = record["chatId"]
+                    exists = connection.execute(
+                        select(db.messages.c.id).where(db.messages.c.chatId == current_chat).limit(1)
+                    ).first()
+                    if exists:
+                        skipped.add(current_chat)
+                if current_chat in skipped:
+                    continue
+                pending.append(record)
+                if len(pending) >= batch_size:
+                    flush()
+            elif kind == "chat" and record["id"] not in skipped:
+                flush()
+                # The summary covers messages up to an old id: point it at the matching new id
+                summarized_up_to = record.get("summarizedUpTo") or 0
+                record["summarizedUpTo"] = max(
+                    (new for old, new in id_map if old <= summarized_up_to), default=0
+                ) if record["id"] == current_chat else 0
+                connection.execute(db.chats.insert().prefix_with("OR IGNORE"), [record])
+        flush()
+    return imported, len(skipped)
+
+
+def compact_all(user_ids, workers=None, **options):
+    """
+    Compact users in parallel in a process pool, printing each user's result as it finishes.
+    :return: List of per-user statistics.
+    """
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(compact_user, user_id, base_dir=db.BASE_DB_DIR, **options): user_id
+            for user_id in user_ids
+        }
+        for future in as_completed(futures):
+            try:
+                stats = future.result()
+            except Exception as e:
+                print(f"Error compacting user {futures[future]}: {e}")
+                continue
+            results.append(stats)
+            reclaimed = stats["bytes_before"] - stats["bytes_after"]
+            print(
+                f"{stats['user']}: {stats['chats']} chats, {stats['messages']} messages archived "
+                f"({stats['archive_bytes'] / 1024:.1f} KB), {reclaimed / 1024:.1f} KB reclaimed "
+                f"in {stats['seconds']:.2f}s"
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old chats of the per-user databases and reclaim space.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    compact = commands.add_parser("compact", help="Archive and delete old chats, then vacuum")
+    compact.add_argument("users", nargs="*", help="Users to compact (default: every user database file)")
+    compact.add_argument("--keep-chats", type=int, default=50, help="Most recently active chats kept per user")
+    compact.add_argument("--older-than", type=float, default=None, help="Only archive chats created this many days ago")
+    compact.add_argument("--archive-dir", default=ARCHIVE_DIR, help="Directory receiving the archives")
+    compact.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    compact.add_argument("--batch-size", type=int, default=COMPACT_BATCH_SIZE, help="Rows per batch")
+    compact.add_argument("--dry-run", action="store_true", help="Only count the chats that would be archived")
+
+    restore = commands.add_parser("import", help="Load an archive back into a user's database")
+    restore.add_argument("user")
+    restore.add_argument("archives", nargs="+")
+    restore.add_argument("--batch-size", type=int, default=COMPACT_BATCH_SIZE, help="Rows per insert")
+    args = parser.parse_args()
+
+    if db.STORAGE_BACKEND != "per_user":
+        print("Maintenance works on the per-user SQLite files only (STORAGE_BACKEND=per_user).")
+        return
+
+    start = time.perf_counter()
+    if args.command == "import":
+        total = 0
+        for path in args.archives:
+            imported, skipped = import_archive(args.user, path, args.batch_size)
+            total += imported
+            print(f"Imported {imported} messages from {path}, skipped {skipped} chats already present")
+        elapsed = time.perf_counter() - start
+        print(f"Imported {total} messages in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} rows/s)")
+        return
+
+    results = compact_all(
+        args.users or db.list_user_database_files(), args.workers, archive_dir=args.archive_dir,
+        keep_chats=args.keep_chats, older_than_days=args.older_than, batch_size=args.batch_size,
+        dry_run=args.dry_run,
+    )
+    elapsed = time.perf_counter() - start
+    messages = sum(stats["messages"] for stats in results)
+    reclaimed = sum(stats["bytes_before"] - stats["bytes_after"] for stats in results)
+    print(
+        f"Compacted {len(results)} users: {messages} messages archived, {reclaimed / 1024 / 1024:.1f} MB reclaimed "
+        f"in {elapsed:.1f}s ({messages / max(elapsed, 1e-9):.0f} rows/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Copy per-user SQLite databases into the shared storage layout (see SharedStorage in database/db.py).
+
+Each user is copied in one transaction, rows are streamed in chunks and inserted in bulk.
+Message ids change in the shared database, so embeddings are remapped and the user's FAISS
+index is rebuilt with the new ids (the per-user index is kept as <user>.faiss.per_user).
+
+Usage: python -m database.migrate_storage [users ...] [--url postgresql+psycopg2://...]
+           [--source-dir database/user_databases] [--chunk-size 5000] [--replace]
+"""
+import argparse
+import os
+import time
+from bisect import bisect_right
+
+from sqlalchemy import create_engine, inspect, select
+
+from database import db
+
+
+def open_user_database(path):
+    """
+    Open a per-user database file read-only.
+    """
+    return create_engine(f"sqlite:///file:{os.path.abspath(path)}?mode=ro&uri=true")
+
+
+def _chunks(result, chunk_size):
+    while True:
+        rows = result.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield [row._asdict() for row in rows]
+
+
+def delete_user(connection, target, user_id):
+    """
+    Remove every row of a user from the shared database.
+    """
+    for table in (target.message_embeddings, target.messages, target.chats):
+        connection.execute(table.delete().where(table.c.userId == user_id))
+
+
+def copy_user(source_path, target, user_id, chunk_size=5000, replace=False):
+    """
+    Copy one user's chats, messages and embeddings into the shared database.
+    :param replace: Delete the user's existing rows in the same transaction first.
+    :return: (message count, {old message id: new message id}, embedding count).
+    """
+    source = open_user_database(source_path)
+    id_map = {}
+    embeddings = 0
+    try:
+        # Files created by older versions may miss tables added since
+        tables = set(inspect(source).get_table_names())
+        with source.connect() as reader, target.engine().begin() as writer:
+            if replace:
+                delete_user(writer, target, user_id)
+            if "messages" in tables:
+                result = reader.execution_options(stream_results=True).execute(
+                    select(db.messages).order_by(db.messages.c.id)
+                )
+                insert = target.messages.insert().returning(target.messages.c.id, sort_by_parameter_order=True)
+                for rows in _chunks(result, chunk_size):
+                    old_ids = [row.pop("id") for row in rows]
+                    new_ids = writer.execute(insert, target.with_user(user_id, rows)).scalars().all()
+                    id_map.update(zip(old_ids, new_ids))
+
+            if "message_embeddings" in tables:
+                result = reader.execution_options(stream_results=True).execute(
+                    select(db.message_embeddings).order_by(db.message_embeddings.c.messageRowId)
+                )
+                for rows in _chunks(result, chunk_size):
+                    rows = [dict(row, messageRowId=id_map[row["messageRowId"]]) for row in rows
+                            if row["messageRowId"] in id_map]
+                    if rows:
+                        writer.execute(target.message_embeddings.insert(), target.with_user(user_id, rows))
+                        embeddings += len(rows)
+
+            if "chats" in tables:
+                # Summaries cover messages up to an old id: point them at the matching new id.
+                # Messages are copied in id order, so both id lists are sorted
+                old_ids, new_ids = list(id_map), list(id_map.values())
+                result = reader.execution_options(stream_results=True).execute(select(db.chats))
+                for rows in _chunks(result, chunk_size):
+                    for row in rows:
+                        position = bisect_right(old_ids, row["summarizedUpTo"] or 0)
+                        row["summarizedUpTo"] = new_ids[position - 1] if position else 0
+                    writer.execute(target.chats.insert(), target.with_user(user_id, rows))
+    finally:
+        source.dispose()
+    return len(id_map), id_map, embeddings
+
+
+def rebuild_vector_index(target, user_id, chunk_size=5000):
+    """
+    Rebuild a user's FAISS index from the embeddings stored in the shared database.
+    """
+    try:
+        from helper.embedding_pipeline import blob_to_vector
+        from helper.vector_index import UserVectorIndex, get_index_path
+    except ImportError as e:
+        print(f"Skipping vector index of {user_id}, rebuild it with the embedding backfill: {e}")
+        return
+
+    path = get_index_path(user_id)
+    # Keep the index of the per-user layout from the first run, later runs replace their own output
+    if (os.path.exists(path) or os.path.exists(f"{path}.log")) and not os.path.exists(f"{path}.per_user"):
+        if os.path.exists(f"{path}.log"):
+            UserVectorIndex(user_id).save(force=True)  # Fold the addition log into the index file first
+        os.replace(path, f"{path}.per_user")
+
+    index = UserVectorIndex(user_id, load=False)
+    table = target.message_embeddings
+    query = select(table.c.messageRowId, table.c.vector).where(table.c.userId == user_id).order_by(table.c.messageRowId)
+    with target.engine().connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(query)
+        for rows in _chunks(result, chunk_size):
+            index.add([row["messageRowId"] for row in rows], [blob_to_vector(row["vector"]) for row in rows],
+                      persist=False)
+    index.save(force=True)
+
+
+def migrate(target, user_ids, chunk_size=5000, replace=False):
+    """
+    Copy per-user databases from BASE_DB_DIR into the shared storage backend.
+    :return: Number of users copied.
+    """
+    copied = 0
+    for user_id in user_ids:
+        source_path = os.path.join(db.BASE_DB_DIR, f"{user_id}.db")
+        if not os.path.exists(source_path):
+            print(f"No database file for user {user_id}, skipping.")
+            continue
+        if not replace and target.user_exists(user_id):
+            print(f"User {user_id} is already in the shared database, skipping (use --replace).")
+            continue
+
+        start = time.perf_counter()
+        message_count, _, embedding_count = copy_user(source_path, target, user_id, chunk_size, replace)
+        if embedding_count:
+            rebuild_vector_index(target, user_id, chunk_size)
+        elapsed = time.perf_counter() - start
+        print(f"Copied {user_id}: {message_count} messages, {embedding_count} embeddings in {elapsed:.2f}s")
+        copied += 1
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy per-user SQLite databases into the shared database.")
+    parser.add_argument("users", nargs="*", help="Users to copy (default: every user database file)")
+    parser.add_argument("--url", default=db.STORAGE_URL, help="SQLAlchemy URL of the shared database")
+    parser.add_argument("--source-dir", default=db.BASE_DB_DIR, help="Directory of the per-user databases")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Rows read and inserted per batch")
+    parser.add_argument("--replace", action="store_true", help="Overwrite users already in the shared database")
+    args = parser.parse_args()
+
+    db.BASE_DB_DIR = args.source_dir
+    target = db.SharedStorage(args.url)
+    start = time.perf_counter()
+    copied = migrate(target, args.users or db.list_user_database_files(), args.chunk_size, args.replace)
+    target.dispose()
+    print(f"Copied {copied} users in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
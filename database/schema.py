@@ -1,4 +1,4 @@
-from sqlalchemy import Table, Column, Integer, String, Text, Enum, JSON, MetaData
+from sqlalchemy import Table, Column, Index, Integer, LargeBinary, String, Text, Enum, JSON, MetaData
 
 # Metadata object
 metadata = MetaData()
@@ -15,6 +15,9 @@ messages = Table(
     Column('metadata', JSON),
 )
 
+# Index used to read the tail of a chat without scanning the whole table
+Index('idx_messages_chat_id', messages.c.chatId, messages.c.id)
+
 # Chats table
 chats = Table(
     'chats',
@@ -23,4 +26,16 @@ chats = Table(
     Column('title', Text, nullable=False),
     Column('createdAt', Text, nullable=False),
     Column('focusMode', Text, nullable=False),
+    Column('summary', Text),  # Rolling summary of the messages up to summarizedUpTo
+    Column('summarizedUpTo', Integer, nullable=False, server_default='0'),  # messages.id
+)
+
+# Message embeddings side table (vectors stored as float16 blobs)
+message_embeddings = Table(
+    'message_embeddings',
+    metadata,
+    Column('messageRowId', Integer, primary_key=True),  # messages.id
+    Column('model', Text, nullable=False),
+    Column('dim', Integer, nullable=False),
+    Column('vector', LargeBinary, nullable=False),
 )
@@ -0,0 +1,174 @@
+"""
+Write-behind queue that group-commits messages per user database.
+
+Durability guarantees:
+- A message is durable once the Future returned by submit()/submit_many() has resolved:
+  its group commit succeeded. Waiting on the Future gives the same guarantee as add_message.
+- Until then the message only lives in process memory. If the process is killed (SIGKILL,
+  crash, power loss), messages submitted during the last commit window (at most `window`
+  seconds, or `max_batch` messages per user) are lost.
+- On a clean shutdown, close() (registered with atexit for the shared writer) flushes every
+  pending message before returning, so nothing acknowledged is dropped.
+- Messages of one user are committed in submission order. When a group commit fails, each
+  submitted batch is retried in its own transaction, so a rejected message only drops the batch
+  it was submitted with. A batch failing on a constraint resolves its Future with an empty row
+  id list, the same result as add_messages; any other error is set as its Future's exception.
+- Commits use WAL with synchronous=NORMAL (see SQLITE_PRAGMAS): a committed transaction survives
+  an application crash, but the last commits may be rolled back by an OS crash or power loss.
+"""
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from database.db import add_messages
+
+WRITE_BEHIND_WINDOW = float(os.getenv("WRITE_BEHIND_WINDOW_MS", "20")) / 1000  # Seconds
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "256"))  # Messages per user and commit
+
+
+class WriteBehindWriter:
+    def __init__(self, window=WRITE_BEHIND_WINDOW, max_batch=WRITE_BEHIND_MAX_BATCH):
+        """
+        Initialize a writer that commits queued messages of each user in one transaction.
+        :param window: Seconds messages may wait so that others can join the same commit.
+        :param max_batch: Pending messages of a user that trigger a commit before the window ends.
+        """
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}  # user_id -> [(messages, future)]
+        self._condition = threading.Condition()
+        self._commit_lock = threading.Lock()
+        self._closed = False
+        self.commits = 0
+        self.committed = 0
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id, chat_id, message_id, content, role, metadata=None):
+        """
+        Queue a message. Same arguments as add_message.
+        :return: Future resolved with the message's row id list once committed.
+        """
+        return self.submit_many(user_id, [{
+            "chat_id": chat_id,
+            "message_id": message_id,
+            "content": content,
+            "role": role,
+            "metadata": metadata,
+        }])
+
+    def submit_many(self, user_id, new_messages):
+        """
+        Queue several messages (dicts as accepted by add_messages) to be committed together.
+        :return: Future resolved with their row ids once committed.
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Write-behind writer is closed")
+            self._pending.setdefault(user_id, []).append((new_messages, future))
+            # Wakes the writer to open a commit window, or to commit early once a batch is full
+            self._condition.notify()
+        return future
+
+    def _commit_pending(self):
+        """
+        Commit every pending message, one transaction per user.
+        Commits are serialized so each user's messages are stored in submission order.
+        """
+        with self._commit_lock:
+            with self._condition:
+                pending, self._pending = self._pending, {}
+
+            for user_id, batches in pending.items():
+                self._commit_batches(user_id, batches)
+
+    def _commit_batches(self, user_id, batches):
+        """
+        Commit batches of one user in a single transaction, retrying them one by one if it fails.
+        """
+        rows = [message for batch, _ in batches for message in batch]
+        error = None
+        try:
+            row_ids = add_messages(user_id, rows)
+        except Exception as e:
+            row_ids, error = [], e
+        if rows and not row_ids and len(batches) > 1:
+            # One rejected message rolled back the whole group: only its own batch is dropped
+            for batch in batches:
+                self._commit_batches(user_id, [batch])
+            return
+        if error is not None:
+            for _, future in batches:
+                future.set_exception(error)
+            return
+        self.commits += 1
+        self.committed += len(row_ids)
+
+        offset = 0
+        for batch, future in batches:
+            future.set_result(row_ids[offset:offset + len(batch)] if row_ids else [])
+            offset += len(batch)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if self._closed and not self._pending:
+                    return
+                # Let more messages join the commit until the window ends or a batch is full
+                deadline = time.monotonic() + self.window
+                while not self._closed:
+                    remaining = deadline - time.monotonic()
+                    full = any(
+                        sum(len(batch) for batch, _ in batches) >= self.max_batch
+                        for batches in self._pending.values()
+                    )
+                    if remaining <= 0 or full:
+                        break
+                    self._condition.wait(remaining)
+            self._commit_pending()
+
+    def flush(self):
+        """
+        Commit every pending message now and wait until it is durable.
+        """
+        self._commit_pending()
+
+    def pending(self):
+        """
+        Number of messages waiting for a commit.
+        """
+        with self._condition:
+            return sum(len(batch) for batches in self._pending.values() for batch, _ in batches)
+
+    def close(self):
+        """
+        Stop accepting messages, commit everything pending and stop the writer thread.
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self.flush()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_write_behind_writer():
+    """
+    Get the shared writer, started on first use and flushed at interpreter exit.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = WriteBehindWriter()
+            atexit.register(_writer.close)
+        return _writer
@@ -0,0 +1,207 @@
+"""
+Token-budgeted chat context: a rolling summary of older messages plus the most recent ones.
+
+After each turn the messages that left the recent window are folded into the chat's summary
+(stored in the chats table) in the background, so the context stays bounded however long
+the chat gets and the summary is never recomputed from scratch.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from database.db import (
+    get_chat_summary,
+    get_messages_after,
+    get_recent_messages,
+    register_message_listener,
+    save_chat_summary,
+)
+from helper.metrics import timed
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1024"))  # Summary + recent messages
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "256"))  # Maximum size of a summary
+CONTEXT_RECENT_LIMIT = 20  # Recent messages read before packing
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "6"))  # Latest messages left out of the summary
+SUMMARY_FOLD_MIN = 4  # Fold only once this many messages left the recent window
+SUMMARY_INPUT_BUDGET = 2048  # Tokens of messages folded per summary update
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """
+    Rough token count of a text (about four characters per token for English).
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text, max_tokens, keep="start"):
+    """
+    Cut a text to about max_tokens tokens, keeping its start or its end.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    if max_chars <= 3:
+        return ""
+    return text[:max_chars - 3] + "..." if keep == "start" else "..." + text[-(max_chars - 3):]
+
+
+def format_message(message):
+    return f"{message.role.capitalize()}: {message.content}"
+
+
+@timed("context.build")
+def build_context(user_id, chat_id, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Build the context of a chat: its rolling summary followed by the most recent messages
+    that are not summarized yet, newest kept first, within `budget` tokens.
+    :return: Context string, or None if the chat has no messages.
+    """
+    summary, summarized_up_to = get_chat_summary(user_id, chat_id)
+    recent = get_recent_messages(user_id, chat_id, limit=CONTEXT_RECENT_LIMIT, after_id=summarized_up_to)
+    if not summary and not recent:
+        return None
+
+    header = ""
+    if summary:
+        header = "Summary of earlier messages: " + truncate_to_tokens(summary, min(SUMMARY_TOKEN_BUDGET, budget // 2))
+    remaining = budget - estimate_tokens(header)
+
+    lines = []
+    for message in reversed(recent):
+        line = format_message(message)
+        cost = estimate_tokens(line) + 1
+        if cost > remaining:
+            if not lines and remaining > 0:
+                # Always keep part of the latest message
+                lines.append(truncate_to_tokens(line, remaining - 1))
+            break
+        lines.append(line)
+        remaining -= cost
+    lines.reverse()
+    return "\n".join([header] + lines if header else lines)
+
+
+def summarize_with_llm(summary, messages, max_tokens=SUMMARY_TOKEN_BUDGET):
+    """
+    Fold messages into a running summary with the configured LLM backend.
+    """
+    from helper.ollama import query_llm
+
+    prompt = (
+        f"Current summary of the conversation:\n{summary or '(empty)'}\n\n"
+        f"New messages:\n" + "\n".join(
+            truncate_to_tokens(format_message(message), SUMMARY_INPUT_BUDGET // 4) for message in messages
+        ) + "\n\n"
+        f"Rewrite the summary so it also covers the new messages. Keep the topics, questions and "
+        f"conclusions, and answer with the summary only, in at most {max_tokens * 3 // 4} words."
+    )
+    return query_llm(prompt)
+
+
+def summarize_extractive(summary, messages, max_tokens=SUMMARY_TOKEN_BUDGET):
+    """
+    Fold messages into a running summary without an LLM: append their starts, keep the newest text.
+    """
+    notes = [truncate_to_tokens(format_message(message), 40) for message in messages]
+    return truncate_to_tokens(" ".join(filter(None, [summary] + notes)), max_tokens, keep="end")
+
+
+class SummaryUpdater:
+    def __init__(self, summarize=summarize_with_llm, keep_recent=SUMMARY_KEEP_RECENT, fold_min=SUMMARY_FOLD_MIN):
+        """
+        Initialize a background updater of rolling chat summaries.
+        :param summarize: Callable (summary, messages) -> new summary.
+        :param keep_recent: Latest messages of a chat left out of its summary.
+        :param fold_min: Messages that must have left the recent window before an update runs.
+        """
+        self.summarize = summarize
+        self.keep_recent = keep_recent
+        self.fold_min = fold_min
+        # One worker, so updates of a chat never run concurrently
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+        self._queued = set()
+        self._lock = threading.Lock()
+        self.updates = 0
+
+    def schedule(self, user_id, chat_id):
+        """
+        Queue a summary update of a chat, unless one is already queued.
+        """
+        key = (user_id, chat_id)
+        with self._lock:
+            if key in self._queued:
+                return
+            self._queued.add(key)
+        self._executor.submit(self._run, key)
+
+    def on_message(self, user_id, row_id, chat_id, content, role):
+        """
+        Message listener: update the summary once a turn ends with the assistant's answer.
+        """
+        if role == "assistant":
+            self.schedule(user_id, chat_id)
+
+    def _run(self, key):
+        with self._lock:
+            self._queued.discard(key)
+        try:
+            self.update(*key)
+        except Exception as e:
+            print(f"Error updating the summary of chat {key[1]} for user {key[0]}: {e}")
+
+    def update(self, user_id, chat_id):
+        """
+        Fold the messages that left the recent window into the chat's summary.
+        :return: True if the summary was updated.
+        """
+        summary, summarized_up_to = get_chat_summary(user_id, chat_id)
+        pending = get_messages_after(
+            user_id, chat_id, after_id=summarized_up_to, limit=CONTEXT_RECENT_LIMIT * 5 + self.keep_recent
+        )
+        foldable = pending[:max(0, len(pending) - self.keep_recent)]
+        if len(foldable) < self.fold_min:
+            return False
+
+        # Bound the summarizer input, the rest is folded by the next update
+        batch, used = [], 0
+        for message in foldable:
+            line_tokens = min(estimate_tokens(format_message(message)), SUMMARY_INPUT_BUDGET // 4)
+            if batch and used + line_tokens > SUMMARY_INPUT_BUDGET:
+                break
+            batch.append(message)
+            used += line_tokens
+
+        new_summary = None
+        try:
+            new_summary = self.summarize(summary, batch)
+        except Exception as e:
+            print(f"Error summarizing chat {chat_id} for user {user_id}: {e}")
+        if not new_summary:
+            new_summary = summarize_extractive(summary, batch)
+
+        title = truncate_to_tokens(pending[0].content, 20) if summarized_up_to == 0 else ""
+        save_chat_summary(
+            user_id, chat_id, truncate_to_tokens(new_summary.strip(), SUMMARY_TOKEN_BUDGET), batch[-1].id,
+            title=title,
+        )
+        self.updates += 1
+        return True
+
+    def flush(self):
+        """
+        Wait for the queued updates to finish.
+        """
+        self._executor.submit(lambda: None).result()
+
+
+# Shared updater fed by add_message / add_messages once registered
+summary_updater = SummaryUpdater()
+
+
+def register_summary_listener(updater=summary_updater):
+    """
+    Keep the rolling summaries of chats up to date as messages are stored.
+    Called by the applications at startup (main.py, server.py).
+    """
+    register_message_listener(updater.on_message)
@@ -0,0 +1,225 @@
+import argparse
+import atexit
+import queue
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from database.db import get_messages_without_embeddings, list_user_ids, register_message_listener, store_embeddings
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_QUEUE_SIZE = 10000
+BATCH_WINDOW = 0.05  # Seconds to wait for more messages before encoding a partial batch
+SUBMIT_TIMEOUT = 5.0  # Seconds add_message may block when the queue is full
+
+_STOP = object()
+
+
+def encode_with_sentence_transformer(texts, batch_size):
+    """
+    Encode texts with the shared SentenceTransformer model, normalized to unit length.
+    """
+    from helper.similarity import get_model
+
+    return get_model().encode(texts, batch_size=batch_size, normalize_embeddings=True)
+
+
+def vector_to_blob(vector):
+    """
+    Serialize an embedding as a compact float16 blob.
+    """
+    return np.asarray(vector, dtype=np.float16).tobytes()
+
+
+def blob_to_vector(blob):
+    """
+    Deserialize a float16 blob back into a float32 embedding.
+    """
+    return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+
+
+class EmbeddingPipeline:
+    def __init__(self, encode=encode_with_sentence_transformer, batch_size=EMBEDDING_BATCH_SIZE,
+                 max_queue=EMBEDDING_QUEUE_SIZE, batch_window=BATCH_WINDOW, submit_timeout=SUBMIT_TIMEOUT,
+                 model_name=EMBEDDING_MODEL_NAME):
+        """
+        Initialize a background worker that embeds stored messages in batches.
+        :param encode: Function (texts, batch_size) -> matrix of unit-length embeddings.
+        :param batch_size: Maximum number of messages encoded together.
+        :param max_queue: Maximum number of pending messages before submitters block.
+        :param batch_window: Seconds to wait for a batch to fill before encoding it.
+        :param submit_timeout: Seconds submit() blocks on a full queue before dropping the message.
+        :param model_name: Model name stored alongside each embedding.
+        """
+        self.encode = encode
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.submit_timeout = submit_timeout
+        self.model_name = model_name
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.embedded = 0
+        self.dropped = 0
+        self.failed = 0
+        self.encode_seconds = 0.0
+
+    def start(self):
+        """
+        Start the worker thread if it is not running.
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embedding-pipeline", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """
+        Process every queued message, then stop the worker thread.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join()
+
+    def flush(self):
+        """
+        Block until every message queued so far has been embedded and stored.
+        """
+        self._queue.join()
+
+    def submit(self, user_id, row_id, chat_id, content, role, block=False):
+        """
+        Queue a stored message for embedding. Matches the add_message listener signature.
+        Blocks up to submit_timeout on a full queue (or indefinitely with block=True).
+        :return: True if the message was queued, False if it was dropped.
+        """
+        self.start()
+        try:
+            self._queue.put((user_id, row_id, content), timeout=None if block else self.submit_timeout)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            print(f"Embedding queue full, dropping message {row_id} for user {user_id}")
+            return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+
+            batch = [item]
+            deadline = time.monotonic() + self.batch_window
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            try:
+                self._process(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                print(f"Error embedding batch of {len(batch)} messages: {e}")
+            finally:
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _process(self, batch):
+        """
+        Encode a batch in one call, then store the vectors per user.
+        """
+        from helper.vector_index import get_user_index
+
+        start = time.perf_counter()
+        vectors = np.asarray(self.encode([content for _, _, content in batch], self.batch_size), dtype=np.float32)
+        self.encode_seconds += time.perf_counter() - start
+
+        by_user = defaultdict(list)
+        for (user_id, row_id, _), vector in zip(batch, vectors):
+            by_user[user_id].append((row_id, vector))
+
+        for user_id, items in by_user.items():
+            store_embeddings(user_id, [
+                {"messageRowId": row_id, "model": self.model_name, "dim": len(vector), "vector": vector_to_blob(vector)}
+                for row_id, vector in items
+            ])
+            get_user_index(user_id).add([row_id for row_id, _ in items], [vector for _, vector in items])
+        self.embedded += len(batch)
+
+    def backfill(self, user_ids=None, chunk_size=1000):
+        """
+        Queue every stored message without an embedding and wait until they are processed.
+        :param user_ids: Users to backfill, defaults to every user with a database file.
+        :return: Number of messages queued.
+        """
+        queued = 0
+        for user_id in user_ids or list_user_ids():
+            after_id = 0
+            while True:
+                rows = get_messages_without_embeddings(user_id, after_id=after_id, limit=chunk_size)
+                if not rows:
+                    break
+                for row_id, content in rows:
+                    self.submit(user_id, row_id, None, content, None, block=True)
+                after_id = rows[-1][0]
+                queued += len(rows)
+        self.flush()
+        return queued
+
+    def stats(self):
+        """
+        Return throughput and queue metrics.
+        """
+        return {
+            "queue_depth": self._queue.qsize(),
+            "embedded": self.embedded,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "embeddings_per_sec": self.embedded / self.encode_seconds if self.encode_seconds else 0.0,
+        }
+
+
+# Shared pipeline fed by add_message, drained on shutdown
+embedding_pipeline = EmbeddingPipeline()
+atexit.register(embedding_pipeline.stop)
+
+
+def register_embedding_listener(pipeline=embedding_pipeline):
+    """
+    Embed and index every message stored from now on, in batches on the pipeline's worker.
+    Called by the applications at startup (main.py, server.py).
+    """
+    register_message_listener(pipeline.submit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed stored messages that have no embedding yet.")
+    parser.add_argument("users", nargs="*", help="Users to backfill (default: all users)")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE)
+    args = parser.parse_args()
+
+    pipeline = EmbeddingPipeline(batch_size=args.batch_size)
+    start = time.perf_counter()
+    queued = pipeline.backfill(args.users or None)
+    pipeline.stop()
+    elapsed = time.perf_counter() - start
+    print(f"Backfilled {queued} messages in {elapsed:.1f}s: {pipeline.stats()}")
+
+
+if __name__ == "__main__":
+    main()
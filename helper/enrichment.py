@@ -0,0 +1,374 @@
+"""
+Enrich search results with text extracted from their pages.
+
+Result pages are fetched concurrently by a bounded thread pool, with a limit of connections
+per host and a content cache. Pages are parsed while they stream in and reading stops once
+enough text was extracted. The extracted passages are reranked by embedding similarity to the
+query in a single batch, so the LLM gets the most relevant extracts instead of bare titles.
+
+Result URLs come from the web, so enrichment is off unless ENRICH_ENABLED is set, and every
+connection is refused unless the address it actually connected to is public. The address is
+checked on the socket, which covers redirects and hosts that resolve differently on each lookup.
+"""
+import codecs
+import hashlib
+import ipaddress
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from helper.metrics import span, timed
+from helper.search_cache import SearchCache
+
+ENRICH_ENABLED = os.getenv("ENRICH_ENABLED", "false").lower() in ("1", "true", "yes")
+ENRICH_WORKERS = int(os.getenv("ENRICH_WORKERS", "8"))  # Pages fetched at the same time
+ENRICH_PER_HOST = int(os.getenv("ENRICH_PER_HOST", "2"))  # Concurrent requests to one host
+ENRICH_MAX_PAGES = int(os.getenv("ENRICH_MAX_PAGES", "5"))  # Results whose pages are fetched
+ENRICH_TIMEOUT = float(os.getenv("ENRICH_TIMEOUT", "5"))  # Seconds for all pages of a search
+ENRICH_MAX_BYTES = 512 * 1024  # Stop reading a page after this many bytes
+ENRICH_MAX_CHARS = 8000  # Stop reading a page after extracting this much text
+ENRICH_MAX_REDIRECTS = 5  # Redirects followed per page
+# Allow fetching pages on loopback, private and link-local addresses (local testing only)
+ENRICH_ALLOW_PRIVATE = os.getenv("ENRICH_ALLOW_PRIVATE", "false").lower() in ("1", "true", "yes")
+PASSAGE_CHARS = 600  # Size of the passages that are reranked
+TOP_PASSAGES = 5
+USER_AGENT = "Mozilla/5.0 (compatible; PerplexityPy/1.0)"
+
+# Extracted page text, keyed by a digest of the URL
+page_cache = SearchCache(
+    ttl=float(os.getenv("PAGE_CACHE_TTL", "3600")),
+    max_entries=int(os.getenv("PAGE_CACHE_MAX_ENTRIES", "512")),
+    max_bytes=int(os.getenv("PAGE_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+    disk_path=None,
+)
+
+
+class NonPublicAddressError(OSError):
+    """
+    Raised when a page connection reaches a loopback, private, link-local or reserved address.
+    """
+
+
+def is_public_address(address):
+    """
+    Whether an IP address is globally routable and not multicast.
+    """
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    return ip.is_global and not ip.is_multicast
+
+
+def _check_peer(sock, host):
+    if ENRICH_ALLOW_PRIVATE:
+        return
+    address = sock.getpeername()[0]
+    if not is_public_address(address):
+        sock.close()
+        raise NonPublicAddressError(f"{host} resolved to non-public address {address}")
+
+
+class _PublicHTTPConnection(HTTPConnection):
+    def _new_conn(self):
+        sock = super()._new_conn()
+        _check_peer(sock, self.host)
+        return sock
+
+
+class _PublicHTTPSConnection(HTTPSConnection):
+    def _new_conn(self):
+        # Checked before the TLS handshake, on the address the socket is connected to
+        sock = super()._new_conn()
+        _check_peer(sock, self.host)
+        return sock
+
+
+class _PublicHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _PublicHTTPConnection
+
+
+class _PublicHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _PublicHTTPSConnection
+
+
+class PublicAddressAdapter(HTTPAdapter):
+    """
+    Transport adapter whose connections only reach public addresses (unless ENRICH_ALLOW_PRIVATE).
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _PublicHTTPConnectionPool,
+            "https": _PublicHTTPSConnectionPool,
+        }
+
+
+def _build_page_session():
+    session = requests.Session()
+    adapter = PublicAddressAdapter(pool_connections=ENRICH_WORKERS, pool_maxsize=ENRICH_PER_HOST)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    session.max_redirects = ENRICH_MAX_REDIRECTS
+    session.trust_env = False  # Through a proxy the connected address would be the proxy's, not the page's
+    return session
+
+
+page_session = _build_page_session()
+_executor = ThreadPoolExecutor(max_workers=ENRICH_WORKERS, thread_name_prefix="enrich")
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+# Set once the embedding model failed to load, so reranking goes straight to word overlap
+_embeddings_unavailable = False
+
+
+def _host_slot(url):
+    """
+    Semaphore limiting the concurrent requests to the host of a URL.
+    """
+    host = urlsplit(url).netloc.lower()
+    with _host_slots_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(ENRICH_PER_HOST)
+        return slot
+
+
+class TextExtractor(HTMLParser):
+    """
+    Incremental HTML to text converter that skips scripts, styles and page chrome.
+    """
+    SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg", "head", "nav", "footer"}
+    BLOCK_TAGS = {"p", "div", "br", "li", "h1", "h2", "h3", "h4", "h5", "h6", "tr", "section", "article"}
+
+    def __init__(self, max_chars=ENRICH_MAX_CHARS):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.parts = []
+        self.length = 0
+        self._skipping = 0
+
+    @property
+    def full(self):
+        return self.length >= self.max_chars
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self._skipping += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS and self._skipping:
+            self._skipping -= 1
+
+    def handle_data(self, data):
+        if self._skipping or self.full:
+            return
+        text = " ".join(data.split())
+        if text:
+            self.parts.append(text + " ")
+            self.length += len(text) + 1
+
+    def text(self):
+        lines = (" ".join(line.split()) for line in "".join(self.parts).splitlines())
+        return "\n".join(line for line in lines if line)[:self.max_chars]
+
+
+def _read_page(url, deadline, max_bytes, max_chars):
+    """
+    Download a page and extract its text while it streams in.
+    :return: (text, complete); complete is False when the deadline cut the download short.
+    """
+    slot = _host_slot(url)
+    if not slot.acquire(timeout=max(0.0, deadline - time.monotonic())):
+        return "", False
+    try:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return "", False
+        try:
+            if urlsplit(url).scheme not in ("http", "https"):
+                return "", True
+            with page_session.get(url, stream=True, timeout=remaining) as response:
+                response.raise_for_status()
+                content_type = response.headers.get("Content-Type", "text/html").lower()
+                if "html" not in content_type and not content_type.startswith("text/"):
+                    return "", True
+
+                # requests assumes ISO-8859-1 for text/* without a charset; pages are mostly UTF-8
+                encoding = response.encoding if "charset" in content_type else "utf-8"
+                decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+                if "html" not in content_type:
+                    chunks, size = [], 0
+                    for chunk in response.iter_content(chunk_size=16384):
+                        chunks.append(decoder.decode(chunk))
+                        size += len(chunk)
+                        if size >= max_bytes or sum(map(len, chunks)) >= max_chars:
+                            break
+                        if time.monotonic() > deadline:
+                            return " ".join("".join(chunks).split())[:max_chars], False
+                    return " ".join("".join(chunks).split())[:max_chars], True
+
+                extractor = TextExtractor(max_chars)
+                size = 0
+                for chunk in response.iter_content(chunk_size=16384):
+                    extractor.feed(decoder.decode(chunk))
+                    size += len(chunk)
+                    if size >= max_bytes or extractor.full:
+                        break
+                    if time.monotonic() > deadline:
+                        return extractor.text(), False
+                return extractor.text(), True
+        except (requests.RequestException, LookupError) as e:
+            print(f"Error fetching {url}: {e}")
+            return "", False
+    finally:
+        slot.release()
+
+
+@timed("enrichment.fetch_page")
+def fetch_page_text(url, deadline=None, max_bytes=ENRICH_MAX_BYTES, max_chars=ENRICH_MAX_CHARS):
+    """
+    Download a page and extract its text while it streams in.
+    Reading stops after max_bytes, max_chars of text, or at the deadline (time.monotonic()).
+    Pages on loopback, private, link-local or reserved addresses are not fetched (see ENRICH_ALLOW_PRIVATE).
+    :return: Extracted text, or "" if the page could not be fetched or is not text.
+    """
+    text, _ = _read_page(url, deadline or time.monotonic() + ENRICH_TIMEOUT, max_bytes, max_chars)
+    return text
+
+
+def cached_page_text(url, deadline=None):
+    """
+    Page text through the page cache; concurrent requests for a URL share one download.
+    Text cut short by the deadline is returned but not cached.
+    """
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    deadline = deadline or time.monotonic() + ENRICH_TIMEOUT
+    partial = None
+
+    def fetch():
+        nonlocal partial
+        with span("enrichment.fetch_page"):
+            text, complete = _read_page(url, deadline, ENRICH_MAX_BYTES, ENRICH_MAX_CHARS)
+        if complete:
+            return text
+        partial = text
+        return None
+
+    text = page_cache.get_or_fetch(key, "page", fetch)
+    return partial if partial is not None else text
+
+
+def split_passages(text, size=PASSAGE_CHARS):
+    """
+    Split text into passages of about `size` characters, on sentence boundaries when possible.
+    """
+    sentences = re.split(r"(?<=[.!?])\s+|\n+", text)
+    passages, current = [], ""
+    for sentence in sentences:
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if current and len(current) + len(sentence) + 1 > size:
+            passages.append(current)
+            current = ""
+        current = f"{current} {sentence}".strip() if current else sentence[:size]
+    if current:
+        passages.append(current)
+    return passages
+
+
+def encode_passages(texts):
+    """
+    Embed texts in one batch with the shared Sentence Transformer (unit length rows).
+    """
+    from helper.embedding_pipeline import encode_with_sentence_transformer
+
+    return np.asarray(encode_with_sentence_transformer(texts, batch_size=64), dtype=np.float32)
+
+
+def overlap_scores(query, passages):
+    """
+    Fallback relevance: share of the query words found in each passage.
+    """
+    terms = set(re.findall(r"\w+", query.lower()))
+    if not terms:
+        return np.zeros(len(passages), dtype=np.float32)
+    return np.array(
+        [len(terms & set(re.findall(r"\w+", passage.lower()))) / len(terms) for passage in passages],
+        dtype=np.float32,
+    )
+
+
+@timed("enrichment.rerank")
+def rerank_passages(query, passages, encode=None):
+    """
+    Score passages by cosine similarity to the query, embedding query and passages in one batch.
+    Falls back to word overlap when the embedding model is unavailable.
+    :return: Array of scores, one per passage.
+    """
+    global _embeddings_unavailable
+
+    if encode is None and _embeddings_unavailable:
+        return overlap_scores(query, passages)
+    try:
+        vectors = np.asarray((encode or encode_passages)([query] + passages), dtype=np.float32)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors[1:] @ vectors[0]
+    except Exception as e:  # Model not installed / not loadable
+        _embeddings_unavailable = True
+        print(f"Embedding rerank unavailable, using word overlap: {e}")
+        return overlap_scores(query, passages)
+
+
+@timed("enrichment.enrich")
+def enrich_results(query, results, max_pages=ENRICH_MAX_PAGES, top_passages=TOP_PASSAGES,
+                   timeout=ENRICH_TIMEOUT, encode=None):
+    """
+    Fetch the pages of the top results and return their passages most relevant to the query.
+    Pages not fetched within `timeout` seconds are skipped; their search snippet is still used.
+    :param results: SearxNG results (dicts with title, url and content).
+    :param encode: Callable embedding a list of texts, defaults to the shared Sentence Transformer.
+    :return: List of dicts with title, url, text and score, best first.
+    """
+    results = [result for result in results[:max_pages] if result.get("url")]
+    if not results:
+        return []
+
+    deadline = time.monotonic() + timeout
+    futures = {_executor.submit(cached_page_text, result["url"], deadline): result for result in results}
+    done, _ = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+
+    candidates = []
+    for future, result in futures.items():
+        texts = [result.get("content") or ""]
+        if future in done and future.exception() is None:
+            texts.append(future.result() or "")
+        for passage in split_passages("\n".join(texts)):
+            candidates.append((result, passage))
+    if not candidates:
+        return []
+
+    scores = rerank_passages(query, [passage for _, passage in candidates], encode)
+    best = np.argsort(-scores)[:top_passages]
+    return [
+        {
+            "title": candidates[i][0].get("title", ""),
+            "url": candidates[i][0]["url"],
+            "text": candidates[i][1],
+            "score": float(scores[i]),
+        }
+        for i in best
+    ]
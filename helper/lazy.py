@@ -0,0 +1,48 @@
+import threading
+
+# Every LazySingleton created, so servers can load them all up front
+_registry = []
+
+
+class LazySingleton:
+    def __init__(self, name, factory):
+        """
+        Initialize a value that is created by factory() on first use.
+        :param name: Name used in warm-up reports.
+        :param factory: Zero-argument callable creating the value.
+        """
+        self.name = name
+        self._factory = factory
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def get(self):
+        """
+        Return the value, creating it exactly once even when called from several threads.
+        """
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._value = self._factory()
+                    self._loaded = True
+        return self._value
+
+
+def warm_up(names=None):
+    """
+    Load lazy singletons ahead of the first request, e.g. when a server starts.
+    :param names: Names of the singletons to load, defaults to all of them.
+    :return: List of the names that were loaded.
+    """
+    loaded = []
+    for singleton in list(_registry):
+        if names is None or singleton.name in names:
+            singleton.get()
+            loaded.append(singleton.name)
+    return loaded
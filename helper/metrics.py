@@ -0,0 +1,247 @@
+import atexit
+import bisect
+import contextlib
+import cProfile
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRICS_PORT = os.getenv("METRICS_PORT")  # Serve Prometheus text on this port when set
+METRICS_JSON = os.getenv("METRICS_JSON")  # Write a JSON snapshot to this file at exit when set
+PROFILE_SLOW_TURNS_MS = os.getenv("PROFILE_SLOW_TURNS_MS")  # Profile pipeline stages and turns slower than this
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram, as exported by Prometheus.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+    def observe(self, seconds, error=False):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.errors += error
+
+    def quantile(self, fraction):
+        """
+        Estimate a quantile as the upper bound of the bucket containing it.
+        """
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "errors": self.errors,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip([str(bound) for bound in self.buckets] + ["+Inf"], self.counts)),
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, error=False):
+        """
+        Record a duration for a named span.
+        """
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds, error)
+
+    def snapshot(self):
+        """
+        Return a JSON-serializable summary of every histogram.
+        """
+        with self._lock:
+            return {name: histogram.to_dict() for name, histogram in sorted(self._histograms.items())}
+
+    def to_prometheus(self):
+        """
+        Render every histogram in the Prometheus text exposition format.
+        """
+        lines = [
+            "# HELP span_duration_seconds Duration of instrumented spans.",
+            "# TYPE span_duration_seconds histogram",
+        ]
+        errors = ["# HELP span_errors_total Spans that raised an exception.", "# TYPE span_errors_total counter"]
+        with self._lock:
+            for name, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'span_duration_seconds_bucket{{span="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'span_duration_seconds_sum{{span="{name}"}} {histogram.sum}')
+                lines.append(f'span_duration_seconds_count{{span="{name}"}} {histogram.count}')
+                errors.append(f'span_errors_total{{span="{name}"}} {histogram.errors}')
+        return "\n".join(lines + errors) + "\n"
+
+    def write_json(self, path):
+        """
+        Write a JSON snapshot of every histogram to a file.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+# Shared registry for all spans
+metrics = MetricsRegistry()
+
+
+@contextlib.contextmanager
+def span(name):
+    """
+    Time a block of code and record it in the named histogram.
+    """
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        metrics.observe(name, time.perf_counter() - start, error)
+
+
+def timed(name):
+    """
+    Decorator recording every call of a function (or coroutine function) in the named histogram.
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_stage_timings(pipeline_name, timings):
+    """
+    Pipeline timing listener recording every stage as a span.
+    """
+    for stage_name, seconds in timings.items():
+        metrics.observe(f"agent.{pipeline_name}.{stage_name}", seconds)
+
+
+@contextlib.contextmanager
+def profile_slow(name, threshold_ms=None):
+    """
+    Profile a block with cProfile (or pyinstrument when installed) and save the profile
+    to PROFILE_DIR when it takes longer than threshold_ms. Does nothing unless a threshold
+    is given or PROFILE_SLOW_TURNS_MS is set. Only the calling thread is profiled, so agent
+    pipelines profile each stage on the thread running it (see Pipeline._timed).
+    """
+    if threshold_ms is None and PROFILE_SLOW_TURNS_MS:
+        threshold_ms = float(PROFILE_SLOW_TURNS_MS)
+    if threshold_ms is None:
+        yield
+        return
+
+    try:
+        from pyinstrument import Profiler
+        profiler = Profiler()
+    except ImportError:
+        profiler = cProfile.Profile()
+
+    try:
+        profiler.start() if hasattr(profiler, "start") else profiler.enable()
+    except (RuntimeError, ValueError):
+        # Another profiler is already active on this thread
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.stop() if hasattr(profiler, "stop") else profiler.disable()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms > threshold_ms:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            base = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d%H%M%S')}-{int(elapsed_ms)}ms")
+            if isinstance(profiler, cProfile.Profile):
+                profiler.dump_stats(f"{base}.prof")
+            else:
+                with open(f"{base}.html", "w") as file:
+                    file.write(profiler.output_html())
+            print(f"Slow {name} ({elapsed_ms:.0f} ms) profile saved to {base}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics.json":
+            body, content_type = json.dumps(metrics.snapshot()).encode(), "application/json"
+        else:
+            body, content_type = metrics.to_prometheus().encode(), "text/plain; version=0.0.4"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """
+    Serve /metrics (Prometheus text) and /metrics.json from a background thread.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+def start_exporters():
+    """
+    Start the exporters configured through METRICS_PORT and METRICS_JSON.
+    """
+    if METRICS_PORT:
+        start_metrics_server(int(METRICS_PORT))
+        print(f"Serving metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+    if METRICS_JSON:
+        atexit.register(metrics.write_json, METRICS_JSON)
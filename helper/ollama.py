@@ -1,16 +1,50 @@
-import openai
+import json
+import os
+import threading
+import time
 
-# Set your OpenAI API key
-# openai.api_key = 
+import requests
+from requests.adapters import HTTPAdapter
+
+from helper.lazy import LazySingleton
+from helper.metrics import timed
+
+SYSTEM_PROMPT = "You are an academic assistant."
+
+# LLM backend configuration ("openai" or "ollama")
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+OLLAMA_URL = os.getenv("OLLAMA", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "10m")  # How long Ollama keeps the model loaded
+OLLAMA_TIMEOUT = 120  # Seconds
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "8"))  # Requests in flight to the server
+
+
+def _load_openai():
+    import openai
+
+    # Set your OpenAI API key
+    # openai.api_key = 
+    openai.api_key = os.getenv("OPENAI_API_KEY", openai.api_key)
+    # Point at a compatible server (e.g. a local stand-in) when OPENAI_API_BASE is set
+    openai.api_base = os.getenv("OPENAI_API_BASE", openai.api_base)
+    return openai
+
+
+# OpenAI client module, imported on first use
+_openai = LazySingleton("openai", _load_openai)
+
+
+@timed("llm.openai.complete")
 def query_openai(prompt, model="gpt-4"):
     """
     Query OpenAI API with a given prompt and model.
     """
     try:
-        response = openai.ChatCompletion.create(
+        response = _openai.get().ChatCompletion.create(
             model=model,
             messages=[
-                {"role": "system", "content": "You are an academic assistant."},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ]
         )
@@ -19,3 +53,195 @@ def query_openai(prompt, model="gpt-4"):
     except Exception as e:
         print(f"Error querying OpenAI: {e}")
         return None
+
+
+def stream_openai(prompt, model="gpt-4", stats=None):
+    """
+    Stream a completion from the OpenAI API, yielding content chunks as they arrive.
+    :param prompt: Prompt sent to the model.
+    :param model: Model name.
+    :param stats: Optional dict filled with time_to_first_token, tokens, tokens_per_sec and completed.
+    """
+    if stats is None:
+        stats = {}
+    stats.update(time_to_first_token=None, tokens=0, tokens_per_sec=0.0, completed=False)
+    start = time.perf_counter()
+    try:
+        response = _openai.get().ChatCompletion.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            stream=True,
+        )
+        for chunk in response:
+            content = chunk['choices'][0].get('delta', {}).get('content')
+            if not content:
+                continue
+            if stats["time_to_first_token"] is None:
+                stats["time_to_first_token"] = time.perf_counter() - start
+            stats["tokens"] += 1
+            yield content
+        stats["completed"] = True
+    except Exception as e:
+        print(f"Error streaming from OpenAI: {e}")
+    finally:
+        if stats["time_to_first_token"] is not None and stats["tokens"]:
+            generation_time = time.perf_counter() - start - stats["time_to_first_token"]
+            stats["tokens_per_sec"] = stats["tokens"] / generation_time if generation_time > 0 else 0.0
+
+
+class OpenAIBackend:
+    """
+    LLM backend for the OpenAI chat completion API.
+    """
+
+    def __init__(self, model="gpt-4"):
+        self.model = model
+
+    def preload(self):
+        _openai.get()
+
+    def complete(self, prompt, model=None):
+        return query_openai(prompt, model=model or self.model)
+
+    def stream(self, prompt, model=None, stats=None):
+        return stream_openai(prompt, model=model or self.model, stats=stats)
+
+
+class OllamaBackend:
+    def __init__(self, base_url=OLLAMA_URL, model=OLLAMA_MODEL, keep_alive=OLLAMA_KEEP_ALIVE,
+                 timeout=OLLAMA_TIMEOUT, max_concurrency=OLLAMA_MAX_CONCURRENCY):
+        """
+        Initialize an Ollama backend using a persistent keep-alive HTTP session.
+        Ollama batches the requests it serves in parallel itself (OLLAMA_NUM_PARALLEL on the server),
+        so prompts are sent as they come, with at most max_concurrency requests in flight.
+        :param base_url: URL of the Ollama server.
+        :param model: Default model name.
+        :param keep_alive: How long Ollama keeps the model loaded after a request.
+        :param timeout: Request timeout in seconds.
+        :param max_concurrency: Maximum number of requests (completions and streams) in flight.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def _payload(self, prompt, model, stream):
+        return {
+            "model": model or self.model,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+        }
+
+    def preload(self, model=None):
+        """
+        Load the model into memory ahead of the first request.
+        """
+        response = self.session.post(
+            f"{self.base_url}/api/generate",
+            json={"model": model or self.model, "keep_alive": self.keep_alive},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+
+    @timed("llm.ollama.complete")
+    def _chat(self, prompt, model):
+        response = self.session.post(
+            f"{self.base_url}/api/chat", json=self._payload(prompt, model, stream=False), timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()["message"]["content"]
+
+    def complete(self, prompt, model=None):
+        """
+        Query Ollama with a given prompt, waiting for a free slot when max_concurrency requests are in flight.
+        """
+        try:
+            with self._slots:
+                return self._chat(prompt, model)
+        except Exception as e:
+            print(f"Error querying Ollama: {e}")
+            return None
+
+    def stream(self, prompt, model=None, stats=None):
+        """
+        Stream a completion from Ollama, yielding content chunks as they arrive.
+        :param stats: Optional dict filled with time_to_first_token, tokens, tokens_per_sec and completed.
+        """
+        if stats is None:
+            stats = {}
+        stats.update(time_to_first_token=None, tokens=0, tokens_per_sec=0.0, completed=False)
+        start = time.perf_counter()
+        try:
+            with self._slots, self.session.post(
+                f"{self.base_url}/api/chat", json=self._payload(prompt, model, stream=True),
+                timeout=self.timeout, stream=True,
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    content = chunk.get("message", {}).get("content")
+                    if content:
+                        if stats["time_to_first_token"] is None:
+                            stats["time_to_first_token"] = time.perf_counter() - start
+                        stats["tokens"] += 1
+                        yield content
+                    if chunk.get("done"):
+                        stats["completed"] = True
+                        break
+        except (requests.RequestException, ValueError) as e:
+            print(f"Error streaming from Ollama: {e}")
+        finally:
+            if stats["time_to_first_token"] is not None and stats["tokens"]:
+                generation_time = time.perf_counter() - start - stats["time_to_first_token"]
+                stats["tokens_per_sec"] = stats["tokens"] / generation_time if generation_time > 0 else 0.0
+
+
+LLM_BACKENDS = {
+    "openai": OpenAIBackend,
+    "ollama": OllamaBackend,
+}
+
+
+def _load_backend():
+    if LLM_BACKEND not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM backend '{LLM_BACKEND}', expected one of {sorted(LLM_BACKENDS)}")
+    return LLM_BACKENDS[LLM_BACKEND]()
+
+
+# Backend selected by LLM_BACKEND, created on first use
+_backend = LazySingleton("llm_backend", _load_backend)
+
+
+def get_llm_backend():
+    """
+    Get the configured LLM backend.
+    """
+    return _backend.get()
+
+
+def query_llm(prompt, model=None):
+    """
+    Query the configured LLM backend with a given prompt.
+    """
+    return get_llm_backend().complete(prompt, model=model)
+
+
+def stream_llm(prompt, model=None, stats=None):
+    """
+    Stream a completion from the configured LLM backend.
+    """
+    return get_llm_backend().stream(prompt, model=model, stats=stats)
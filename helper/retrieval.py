@@ -0,0 +1,84 @@
+import os
+
+from database.db import get_messages_by_ids, search_messages
+from helper.metrics import timed
+
+# Constant of reciprocal rank fusion: higher values flatten the advantage of top ranks
+RRF_K = 60
+HYBRID_CANDIDATES = 20  # Hits taken from each retriever before fusion
+HYBRID_USE_VECTORS = os.getenv("HYBRID_USE_VECTORS", "true").lower() in ("1", "true", "yes")
+
+# Set once vector search failed, so later searches go straight to keyword search
+_vectors_unavailable = False
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Merge ranked id lists: every id scores sum(1 / (k + rank)) over the lists it appears in.
+    :return: Ids sorted by decreasing fused score.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def encode_query(query):
+    """
+    Embed a query with the shared Sentence Transformer model.
+    """
+    from helper.similarity import get_model
+
+    return get_model().encode(query, normalize_embeddings=True)
+
+
+@timed("retrieval.lexical")
+def lexical_ranking(user_id, query, candidates=HYBRID_CANDIDATES):
+    """
+    Message ids ranked by BM25 over the FTS5 index.
+    """
+    return [row.id for row in search_messages(user_id, query, limit=candidates)]
+
+
+@timed("retrieval.semantic")
+def semantic_ranking(user_id, query, candidates=HYBRID_CANDIDATES, encode=None):
+    """
+    Message ids ranked by cosine similarity in the user's vector index.
+    """
+    from helper.vector_index import get_user_index
+
+    query_embedding = (encode or encode_query)(query)
+    return [message_id for message_id, _ in get_user_index(user_id).search(query_embedding, top_k=candidates)]
+
+
+@timed("retrieval.hybrid_search")
+def hybrid_search(user_id, query, top_k=5, candidates=HYBRID_CANDIDATES, use_vectors=HYBRID_USE_VECTORS,
+                  encode=None, exclude_chat_id=None):
+    """
+    Find a user's past messages relevant to a query by fusing keyword (BM25) and vector hits.
+    Falls back to keyword hits alone when the embedding model or vector index is unavailable.
+    :param top_k: Maximum number of messages returned.
+    :param candidates: Hits taken from each retriever before fusion.
+    :param use_vectors: Include the vector similarity ranking.
+    :param encode: Callable embedding the query, defaults to the shared Sentence Transformer.
+    :param exclude_chat_id: Leave out messages of this chat, e.g. the one already in the context.
+    :return: Message rows, most relevant first.
+    """
+    global _vectors_unavailable
+
+    rankings = [lexical_ranking(user_id, query, candidates)]
+    if use_vectors and (encode is not None or not _vectors_unavailable):
+        try:
+            rankings.append(semantic_ranking(user_id, query, candidates, encode))
+        except Exception as e:  # Model or index not installed / not loadable
+            _vectors_unavailable = True
+            print(f"Vector search unavailable, using keyword search only: {e}")
+
+    fused = reciprocal_rank_fusion(rankings)
+    if not fused:
+        return []
+    rows = get_messages_by_ids(user_id, fused)
+    if exclude_chat_id is not None:
+        rows = [row for row in rows if row.chatId != exclude_chat_id]
+    return rows[:top_k]
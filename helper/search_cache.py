@@ -0,0 +1,298 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Default configuration for the search result cache
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "600"))  # Seconds
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "2048"))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH")  # Optional SQLite file for the disk tier
+SEARCH_CACHE_DISK_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_DISK_MAX_ENTRIES", "50000"))
+SEARCH_CACHE_DISK_PRUNE_EVERY = 100  # Disk writes between two sweeps of expired and excess rows
+
+
+def normalize_query(query):
+    """
+    Normalize a query for cache lookups (case-folded, collapsed whitespace).
+    """
+    return " ".join(query.casefold().split())
+
+
+def make_cache_key(query, engine):
+    """
+    Build the cache key for a query sent to a specific engine.
+    """
+    return f"{engine}\x1f{normalize_query(query)}"
+
+
+class _Flight:
+    """
+    A fetch in progress that concurrent callers for the same key wait on.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class SearchCache:
+    def __init__(self, ttl=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_MAX_ENTRIES,
+                 max_bytes=SEARCH_CACHE_MAX_BYTES, disk_path=SEARCH_CACHE_PATH,
+                 disk_max_entries=SEARCH_CACHE_DISK_MAX_ENTRIES):
+        """
+        Initialize a TTL + LRU cache for search results.
+        :param ttl: Time to live of an entry in seconds.
+        :param max_entries: Maximum number of entries in the memory tier.
+        :param max_bytes: Maximum serialized size of the memory tier in bytes.
+        :param disk_path: Optional SQLite file used as a persistent second tier.
+        :param disk_max_entries: Maximum number of rows of the disk tier; the entries closest to
+            expiry are pruned first.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_max_entries = disk_max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, size, results)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._in_flight_async = {}
+        self._bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.disk_evictions = 0
+
+        # The disk tier has its own lock, so memory hits never wait on disk I/O
+        self._disk = None
+        self._disk_lock = threading.Lock()
+        self._disk_writes = 0
+        if disk_path:
+            os.makedirs(os.path.dirname(disk_path) or ".", exist_ok=True)
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._disk.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_expires_at ON search_cache (expires_at)")
+            self._disk.commit()
+            with self._disk_lock:
+                self._prune_disk_locked()
+
+    def _store_locked(self, key, results, payload, expires_at):
+        """
+        Insert an entry in the memory tier and evict until the limits are respected.
+        """
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous[1]
+
+        size = len(payload.encode("utf-8"))
+        self._entries[key] = (expires_at, size, results)
+        self._bytes += size
+
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def _memory_lookup_locked(self, key):
+        """
+        Look a key up in the memory tier. Returns None on a miss.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, size, results = entry
+        if expires_at > time.time():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return results
+        del self._entries[key]
+        self._bytes -= size
+        self.expirations += 1
+        return None
+
+    def _disk_lookup(self, key):
+        """
+        Look a key up in the disk tier, outside the memory lock, and promote a hit to memory.
+        Counts a miss when the key is in neither tier. Returns None on a miss.
+        """
+        row = None
+        if self._disk is not None:
+            with self._disk_lock:
+                row = self._disk.execute(
+                    "SELECT value, expires_at FROM search_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+                ).fetchone()
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            payload, expires_at = row
+            results = json.loads(payload)
+            self._store_locked(key, results, payload, expires_at)
+            self.disk_hits += 1
+            return results
+
+    def _prune_disk_locked(self):
+        """
+        Delete expired rows from the disk tier, then the rows closest to expiry above disk_max_entries.
+        """
+        now = time.time()
+        expired = self._disk.execute("DELETE FROM search_cache WHERE expires_at <= ?", (now,)).rowcount
+        excess = self._disk.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0] - self.disk_max_entries
+        if excess > 0:
+            self._disk.execute(
+                "DELETE FROM search_cache WHERE key IN "
+                "(SELECT key FROM search_cache ORDER BY expires_at LIMIT ?)", (excess,)
+            )
+        self._disk.commit()
+        with self._lock:
+            self.expirations += expired
+            self.disk_evictions += max(excess, 0)
+
+    def get(self, query, engine):
+        """
+        Return cached results for a query and engine, or None on a miss.
+        """
+        key = make_cache_key(query, engine)
+        with self._lock:
+            results = self._memory_lookup_locked(key)
+        if results is not None:
+            return results
+        return self._disk_lookup(key)
+
+    def set(self, query, engine, results):
+        """
+        Store results for a query and engine in every tier.
+        """
+        self._set_key(make_cache_key(query, engine), results)
+
+    def _set_key(self, key, results):
+        payload = json.dumps(results)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store_locked(key, results, payload, expires_at)
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, payload, expires_at),
+                )
+                self._disk.commit()
+                self._disk_writes += 1
+                if self._disk_writes % SEARCH_CACHE_DISK_PRUNE_EVERY == 0:
+                    self._prune_disk_locked()
+
+    def get_or_fetch(self, query, engine, fetch):
+        """
+        Return cached results, or call fetch() once and cache what it returns.
+        Concurrent misses for the same key wait for a single upstream fetch.
+        Empty or failed results (None, []) are returned but not cached.
+        """
+        key = make_cache_key(query, engine)
+        with self._lock:
+            results = self._memory_lookup_locked(key)
+            if results is not None:
+                return results
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            return flight.result
+
+        try:
+            # The disk tier is read by the leader only, outside the memory lock
+            flight.result = self._disk_lookup(key)
+            if flight.result is None:
+                flight.result = fetch()
+                if flight.result:
+                    self._set_key(key, flight.result)
+            return flight.result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            flight.event.set()
+
+    async def get_or_fetch_async(self, query, engine, fetch):
+        """
+        Asynchronous variant of get_or_fetch(); fetch is a coroutine function.
+        """
+        key = make_cache_key(query, engine)
+        with self._lock:
+            results = self._memory_lookup_locked(key)
+            if results is not None:
+                return results
+            future = self._in_flight_async.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight_async[key] = asyncio.get_running_loop().create_future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return await asyncio.shield(future)
+
+        try:
+            results = self._disk_lookup(key)
+            if results is None:
+                results = await fetch()
+                if results:
+                    self._set_key(key, results)
+            future.set_result(results)
+            return results
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Mark as retrieved when nobody else is waiting
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight_async[key]
+
+    def clear(self):
+        """
+        Drop every entry from both tiers.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.execute("DELETE FROM search_cache")
+                self._disk.commit()
+
+    def stats(self):
+        """
+        Return hit-rate, size and eviction metrics.
+        """
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions,
+                "expirations": self.expirations,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+# Shared cache used by the SearxNG clients
+search_cache = SearchCache()
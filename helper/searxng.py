@@ -1,25 +1,108 @@
+import asyncio
+import atexit
+import codecs
+import json
+import os
+import re
+import threading
+from urllib.parse import urlsplit, urlunsplit
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from helper.lazy import LazySingleton
+from helper.metrics import timed
+from helper.search_cache import search_cache
 
 # Default configurations for SearxNG
-SEARXNG_URL = "http://localhost:32768"  # Replace with your SearxNG API endpoint
+SEARXNG_URL = os.getenv("SEARXNG", "http://localhost:32768")  # Replace with your SearxNG API endpoint
 SEARXNG_HEADERS = {"Content-Type": "application/json"}
+SEARXNG_TIMEOUT = 10  # Seconds
+SEARXNG_POOL_SIZE = 20  # Maximum keep-alive connections to SearxNG
+VIDEO_RESULTS_LIMIT = 5  # Unique video results returned per query
+VIDEO_MAX_PAGES = 3  # Result pages requested before giving up on reaching the limit
+
+
+def _build_http_session():
+    """
+    Build a shared requests Session with a keep-alive connection pool.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=SEARXNG_POOL_SIZE, pool_maxsize=SEARXNG_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# Shared session so consecutive queries reuse TCP connections
+http_session = _build_http_session()
+
+
+def _load_aiohttp():
+    import aiohttp
+
+    return aiohttp
+
+
+# aiohttp is only needed by the asynchronous client, so it is imported on first use
+_aiohttp = LazySingleton("aiohttp", _load_aiohttp)
+
+
+def normalize_result_url(url):
+    """
+    Normalize a result URL for de-duplication (lowercase host, no fragment or trailing slash).
+    """
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip("/")
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ""))
+
+
+def merge_results(result_lists):
+    """
+    Merge several result lists, de-duplicating by normalized URL.
+    The first occurrence of a URL is kept and the engines that returned it are combined.
+    """
+    merged = {}
+    for results in result_lists:
+        for result in results:
+            url = result.get("url")
+            if not url:
+                continue
+            key = normalize_result_url(url)
+            if key not in merged:
+                merged[key] = dict(result)
+                merged[key]["engines"] = list(result.get("engines", []))
+            else:
+                engines = merged[key]["engines"]
+                engines.extend(e for e in result.get("engines", []) if e not in engines)
+    return list(merged.values())
+
 
 class GoogleSearch:
     @staticmethod
+    @timed("searxng.google.search")
     def search_searxng(query, engine="google"):
         """
-        Query SearxNG and retrieve search results.
+        Query SearxNG and retrieve search results, going through the shared search cache.
         :param query: Search query string.
         :param engine: Specific search engine to use (default: "google").
         :return: List of search results or None in case of an error.
         """
+        return search_cache.get_or_fetch(query, engine, lambda: GoogleSearch._fetch_searxng(query, engine))
+
+    @staticmethod
+    @timed("searxng.google.fetch")
+    def _fetch_searxng(query, engine):
+        """
+        Send the query to SearxNG without consulting the cache.
+        """
         params = {
             "q": query,
             "engines": engine,
             "format": "json"
         }
         try:
-            response = requests.get(SEARXNG_URL, headers=SEARXNG_HEADERS, params=params, timeout=10)
+            response = http_session.get(SEARXNG_URL, headers=SEARXNG_HEADERS, params=params, timeout=SEARXNG_TIMEOUT)
             response.raise_for_status()
             return response.json().get("results", [])
         except requests.RequestException as e:
@@ -28,30 +111,354 @@ class GoogleSearch:
 
 
 
+class VideoResult:
+    """
+    Compact video search result: only the fields the video agent uses, without the thumbnails,
+    iframes and snippets of the full SearXNG result.
+    """
+    __slots__ = ("title", "url", "duration", "channel")
+
+    def __init__(self, title, url, duration=None, channel=None):
+        self.title = title
+        self.url = url
+        self.duration = duration
+        self.channel = channel
+
+    @classmethod
+    def from_result(cls, result):
+        """
+        Build a record from a SearXNG result dict, with its URL canonicalized.
+        """
+        duration = result.get("length") or result.get("duration")
+        return cls(
+            result.get("title") or "No Title",
+            canonicalize_video_url(result.get("url") or ""),
+            str(duration) if duration else None,
+            result.get("author") or result.get("channel") or None,
+        )
+
+    def to_row(self):
+        """
+        JSON-serializable form stored in the search cache.
+        """
+        return [self.title, self.url, self.duration, self.channel]
+
+    def __repr__(self):
+        return f"VideoResult(title={self.title!r}, url={self.url!r})"
+
+
+# Watch, youtu.be, embed, shorts and mobile URLs of a YouTube video, capturing its id
+_YOUTUBE_URL = re.compile(
+    r"^(?:https?://)?(?:(?:www|m|music)\.)?"
+    r"(?:youtube(?:-nocookie)?\.com(?::\d+)?/(?:watch/?\?(?:[^#]*&)?v=|(?:embed|shorts|v|live)/)|youtu\.be(?::\d+)?/)"
+    r"([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])",
+    re.IGNORECASE,
+)
+
+
+def canonicalize_video_url(url):
+    """
+    Map the URL forms of a YouTube video (watch, youtu.be, embed, shorts, mobile) to
+    https://www.youtube.com/watch?v=<id>, so duplicates from different engines and pages
+    collapse. Other URLs are normalized with normalize_result_url().
+    """
+    url = url.strip()
+    match = _YOUTUBE_URL.match(url)
+    if match:
+        return f"https://www.youtube.com/watch?v={match.group(1)}"
+    return normalize_result_url(url) if url else url
+
+
+class _JSONStream:
+    """
+    Reads JSON values one at a time from a stream of byte chunks, buffering only the
+    value being decoded.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.bytes_read = 0
+        self.eof = False
+
+    def _fill(self):
+        """
+        Append the next chunk to the buffer, dropping the consumed part. Returns False at the end.
+        """
+        if self.eof:
+            return False
+        if self.position > 65536:
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self.buffer += self._decoder.decode(b"", final=True)
+            self.eof = True
+            return False
+        self.bytes_read += len(chunk)
+        self.buffer += self._decoder.decode(chunk)
+        return True
+
+    def peek(self):
+        """
+        Skip whitespace and return the next character, or "" at the end of the stream.
+        """
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in " \t\r\n":
+                self.position += 1
+            if self.position < len(self.buffer) or not self._fill():
+                return self.buffer[self.position:self.position + 1]
+
+    def expect(self, characters):
+        """
+        Consume the next character, which must be one of `characters`.
+        """
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError(f"Expected one of {characters!r} at offset {self.position}, got {character!r}")
+        self.position += 1
+        return character
+
+    def value(self):
+        """
+        Decode the next complete JSON value.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self.buffer, self.position)
+                # A number cut at the end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+def iter_video_results(chunks):
+    """
+    Parse a SearXNG JSON response incrementally, yielding a VideoResult per entry of "results".
+    Only one result dict is held in memory at a time, and the caller can stop early.
+    :param chunks: Iterable of byte chunks of the response body.
+    """
+    stream = _JSONStream(chunks)
+    stream.expect("{")
+    if stream.peek() == "}":
+        return
+    while True:
+        key = stream.value()
+        stream.expect(":")
+        if key == "results":
+            stream.expect("[")
+            if stream.peek() == "]":
+                stream.position += 1
+            else:
+                while True:
+                    result = stream.value()
+                    if isinstance(result, dict) and result.get("url"):
+                        yield VideoResult.from_result(result)
+                    if stream.expect(",]") == "]":
+                        break
+        else:
+            stream.value()  # Skip answers, infoboxes, suggestions...
+        if stream.expect(",}") == "}":
+            return
+
+
 class VideoSearch:
-    def __init__(self, searxng_url="http://localhost:32768"):
+    def __init__(self, searxng_url=None, cache=search_cache, session=None):
         """
-        Initialize the VideoSearch instance with a SearXNG URL.
-        :param searxng_url: URL of the SearXNG instance.
+        Initialize a video search client. One instance is shared by all requests (video_search).
+        :param searxng_url: URL of the SearXNG instance (default: SEARXNG_URL).
+        :param cache: SearchCache used for results, or None to disable caching.
+        :param session: requests Session used for queries (default: the shared pooled session).
         """
-        self.searxng_url = searxng_url
+        self.searxng_url = searxng_url or SEARXNG_URL
+        self.cache = cache
+        self.session = session or http_session
 
-    def search(self, query, engine="youtube"):
+    @timed("searxng.video.search")
+    def search(self, query, engine="youtube", limit=VIDEO_RESULTS_LIMIT, max_pages=VIDEO_MAX_PAGES):
         """
         Perform a video search using SearXNG.
         :param query: The search query string.
-        :param engine: The specific search engine to use (default: "youtube").
-        :return: A list of search results.
+        :param engine: The search engine to use, or several separated by commas (default: "youtube").
+        :param limit: Number of unique results wanted; parsing and paging stop once reached.
+        :param max_pages: Maximum number of result pages requested.
+        :return: A list of at most `limit` VideoResult records, de-duplicated by canonical URL.
+        """
+        if self.cache is None:
+            return self._fetch(query, engine, limit, max_pages)
+        rows = self.cache.get_or_fetch(
+            query, f"{engine}#video{limit}",
+            lambda: [result.to_row() for result in self._fetch(query, engine, limit, max_pages)],
+        )
+        return [VideoResult(*row) for row in rows or []]
+
+    @timed("searxng.video.fetch")
+    def _fetch(self, query, engine, limit=VIDEO_RESULTS_LIMIT, max_pages=VIDEO_MAX_PAGES):
+        """
+        Send the query to SearXNG without consulting the cache, page by page until
+        `limit` unique results were found or a page brings nothing new.
+        """
+        results = []
+        seen = set()
+        for page in range(1, max_pages + 1):
+            params = {
+                "q": query,
+                "engines": engine,
+                "format": "json",
+                "pageno": page,
+            }
+            found = 0
+            try:
+                with self.session.get(self.searxng_url, params=params, timeout=SEARXNG_TIMEOUT,
+                                      stream=True) as response:
+                    response.raise_for_status()
+                    for result in iter_video_results(response.iter_content(chunk_size=16384)):
+                        if result.url in seen:
+                            continue
+                        seen.add(result.url)
+                        results.append(result)
+                        found += 1
+                        if len(results) >= limit:
+                            # Closing the response drops the rest of the payload unread
+                            return results
+            except (requests.RequestException, ValueError) as e:
+                print(f"Error querying SearXNG: {e}")
+                return results
+            if not found:
+                break
+        return results
+
+
+# Shared client used by the video agent
+video_search = VideoSearch()
+
+
+class AsyncSearxngClient:
+    def __init__(self, searxng_url=SEARXNG_URL, timeout=SEARXNG_TIMEOUT, engine_timeouts=None,
+                 max_connections=SEARXNG_POOL_SIZE, cache=search_cache):
+        """
+        Initialize an asynchronous SearxNG client backed by a pooled aiohttp session.
+        :param searxng_url: URL of the SearxNG instance.
+        :param timeout: Default per-engine timeout in seconds.
+        :param engine_timeouts: Optional mapping of engine name to timeout in seconds.
+        :param max_connections: Maximum number of pooled connections.
+        :param cache: SearchCache used for results, or None to disable caching.
         """
+        self.searxng_url = searxng_url
+        self.timeout = timeout
+        self.engine_timeouts = dict(engine_timeouts or {})
+        self.max_connections = max_connections
+        self.cache = cache
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _get_session(self):
+        """
+        Lazily create the aiohttp session inside the running event loop.
+        """
+        if self._session is None or self._session.closed:
+            aiohttp = _aiohttp.get()
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(connector=connector, headers=SEARXNG_HEADERS)
+        return self._session
+
+    async def close(self):
+        """
+        Close the underlying HTTP session and its connections.
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @timed("searxng.async.search")
+    async def search(self, query, engine="google", timeout=None):
+        """
+        Query a single SearxNG engine.
+        :param query: Search query string.
+        :param engine: Specific search engine to use (default: "google").
+        :param timeout: Timeout in seconds, overriding the configured engine timeout.
+        :return: List of search results, or an empty list on error or timeout.
+        """
+        if timeout is None:
+            timeout = self.engine_timeouts.get(engine, self.timeout)
+        if self.cache is None:
+            return await self._fetch(query, engine, timeout)
+        return await self.cache.get_or_fetch_async(query, engine, lambda: self._fetch(query, engine, timeout))
+
+    @timed("searxng.async.fetch")
+    async def _fetch(self, query, engine, timeout):
+        """
+        Send the query to SearxNG without consulting the cache.
+        """
+        aiohttp = _aiohttp.get()
         params = {
             "q": query,
             "engines": engine,
             "format": "json",
         }
         try:
-            response = requests.get(self.searxng_url, params=params, timeout=10)
-            response.raise_for_status()
-            return response.json().get("results", [])
-        except requests.RequestException as e:
-            print(f"Error querying SearXNG: {e}")
+            async with asyncio.timeout(timeout):
+                async with self._get_session().get(self.searxng_url, params=params) as response:
+                    response.raise_for_status()
+                    payload = await response.json(content_type=None)
+                    return payload.get("results", [])
+        except TimeoutError:
+            print(f"SearxNG engine '{engine}' timed out after {timeout}s")
+            return []
+        except (aiohttp.ClientError, ValueError) as e:
+            print(f"Error querying SearxNG engine '{engine}': {e}")
             return []
+
+    async def search_engines(self, query, engines):
+        """
+        Query several SearxNG engines concurrently and merge their results.
+        Each engine has its own timeout, so a slow engine only drops its own results.
+        :param query: Search query string.
+        :param engines: Iterable of engine names.
+        :return: Merged list of results, de-duplicated by URL, in engine order.
+        """
+        result_lists = await asyncio.gather(*(self.search(query, engine) for engine in engines))
+        return merge_results(result_lists)
+
+
+def _start_event_loop():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="searxng-async", daemon=True).start()
+    return loop
+
+
+# Event loop thread running the shared asynchronous client for synchronous callers (agent stages)
+_event_loop = LazySingleton("searxng_event_loop", _start_event_loop)
+
+# Shared asynchronous client, so fan-out queries from every agent reuse one connection pool
+async_searxng = AsyncSearxngClient()
+
+
+def search_engines(query, engines):
+    """
+    Query several SearxNG engines concurrently from synchronous code and merge their results.
+    Runs on the shared client's event loop thread; see AsyncSearxngClient.search_engines.
+    """
+    return asyncio.run_coroutine_threadsafe(async_searxng.search_engines(query, engines), _event_loop.get()).result()
+
+
+def _close_async_searxng():
+    if _event_loop.loaded:
+        asyncio.run_coroutine_threadsafe(async_searxng.close(), _event_loop.get()).result(timeout=5)
+
+
+atexit.register(_close_async_searxng)
@@ -0,0 +1,213 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Default configuration for the semantic LLM response cache
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))  # Seconds
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))  # Per namespace
+
+
+def embed_with_sentence_transformer(texts):
+    """
+    Embed texts with the shared SentenceTransformer model, normalized to unit length.
+    """
+    from helper.similarity import get_model
+
+    return get_model().encode(texts, normalize_embeddings=True)
+
+
+class _Namespace:
+    """
+    Cached prompts of one namespace, with their embeddings stacked in a matrix for lookups.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()  # prompt -> (embedding, response, expires_at)
+        self.matrix = None
+        self.keys = []
+
+    def rebuild(self):
+        self.keys = list(self.entries)
+        if self.keys:
+            self.matrix = np.vstack([self.entries[key][0] for key in self.keys])
+        else:
+            self.matrix = None
+
+
+class SemanticCache:
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, ttl=SEMANTIC_CACHE_TTL,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES, embed=embed_with_sentence_transformer):
+        """
+        Initialize a cache that returns stored completions for near-duplicate prompts.
+        :param threshold: Minimum cosine similarity for a cached prompt to match.
+        :param ttl: Time to live of an entry in seconds.
+        :param max_entries: Maximum number of entries per namespace (LRU eviction).
+        :param embed: Function mapping a list of texts to unit-length embedding vectors.
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embed = embed
+        self._namespaces = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _embed_one(self, text):
+        return np.asarray(self.embed([text]), dtype=np.float32)[0]
+
+    def _purge_expired_locked(self, space):
+        now = time.time()
+        expired = [key for key, (_, _, expires_at) in space.entries.items() if expires_at <= now]
+        for key in expired:
+            del space.entries[key]
+        if expired:
+            space.rebuild()
+
+    def lookup(self, namespace, prompt):
+        """
+        Return the cached completion of the most similar prompt above the threshold, or None.
+        """
+        with self._lock:
+            space = self._namespaces.get(namespace)
+            if space is not None:
+                self._purge_expired_locked(space)
+            if space is None or not space.entries:
+                self.misses += 1
+                return None
+            exact = space.entries.get(prompt)
+            if exact is not None:
+                space.entries.move_to_end(prompt)
+                self.hits += 1
+                return exact[1]
+
+        embedding = self._embed_one(prompt)
+
+        with self._lock:
+            if space.matrix is None:
+                self.misses += 1
+                return None
+            scores = space.matrix @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            key = space.keys[best]
+            entry = space.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            space.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def store(self, namespace, prompt, response):
+        """
+        Store a completion for a prompt in a namespace.
+        """
+        embedding = self._embed_one(prompt)
+        with self._lock:
+            space = self._namespaces.setdefault(namespace, _Namespace())
+            space.entries.pop(prompt, None)
+            space.entries[prompt] = (embedding, response, time.time() + self.ttl)
+            while len(space.entries) > self.max_entries:
+                space.entries.popitem(last=False)
+                self.evictions += 1
+            space.rebuild()
+
+    def clear(self, namespace=None):
+        """
+        Drop one namespace, or every namespace when namespace is None.
+        """
+        with self._lock:
+            if namespace is None:
+                self._namespaces.clear()
+            else:
+                self._namespaces.pop(namespace, None)
+
+    def stats(self):
+        """
+        Return hit/miss/eviction counters and the number of entries per namespace.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "namespaces": {name: len(space.entries) for name, space in self._namespaces.items()},
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Shared cache used by the agents when SEMANTIC_CACHE_ENABLED is set
+semantic_cache = SemanticCache()
+
+
+def cached_query(prompt, namespace, llm=None, cache=None, enabled=None, **llm_kwargs):
+    """
+    Query the LLM through the semantic cache.
+    :param prompt: Prompt sent to the LLM.
+    :param namespace: Cache namespace, usually the agent name.
+    :param llm: Callable (prompt, **llm_kwargs) -> completion, defaults to query_llm.
+    :param cache: SemanticCache to use, defaults to the shared cache.
+    :param enabled: Overrides SEMANTIC_CACHE_ENABLED when not None.
+    :return: The cached or freshly generated completion, or None on error.
+    """
+    if llm is None:
+        from helper.ollama import query_llm as llm
+    if cache is None:
+        cache = semantic_cache
+    if enabled is None:
+        enabled = SEMANTIC_CACHE_ENABLED
+    if not enabled:
+        return llm(prompt, **llm_kwargs)
+
+    # Completions from different models must not be shared
+    namespace = f"{namespace}:{llm_kwargs.get('model', '')}"
+    response = cache.lookup(namespace, prompt)
+    if response is not None:
+        return response
+
+    response = llm(prompt, **llm_kwargs)
+    if response:
+        cache.store(namespace, prompt, response)
+    return response
+
+
+def cached_stream(prompt, namespace, stream_llm=None, cache=None, enabled=None, **llm_kwargs):
+    """
+    Streaming variant of cached_query(): yields the cached completion in one chunk on a hit,
+    otherwise streams from stream_llm and caches the completion once it finishes.
+    :param stream_llm: Generator function (prompt, **llm_kwargs) yielding chunks, defaults to the
+        configured backend's stream_llm.
+    """
+    if stream_llm is None:
+        from helper.ollama import stream_llm
+    if cache is None:
+        cache = semantic_cache
+    if enabled is None:
+        enabled = SEMANTIC_CACHE_ENABLED
+    if not enabled:
+        yield from stream_llm(prompt, **llm_kwargs)
+        return
+
+    namespace = f"{namespace}:{llm_kwargs.get('model', '')}"
+    response = cache.lookup(namespace, prompt)
+    if response is not None:
+        yield response
+        return
+
+    stats = llm_kwargs.setdefault("stats", {})
+    chunks = []
+    for chunk in stream_llm(prompt, **llm_kwargs):
+        chunks.append(chunk)
+        yield chunk
+    if chunks and stats.get("completed", True):
+        cache.store(namespace, prompt, "".join(chunks))
@@ -1,24 +1,46 @@
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
-from database.db import get_history
+from database.db import get_messages_by_ids
+from helper.lazy import LazySingleton
+from helper.metrics import timed
+from helper.vector_index import get_user_index
 
-# Initialize Sentence Transformer for embedding
-model = SentenceTransformer('all-MiniLM-L6-v2')
 
+def _load_model():
+    from sentence_transformers import SentenceTransformer
 
-def compute_similarity(user_id, query):
+    return SentenceTransformer('all-MiniLM-L6-v2')
+
+
+# Sentence Transformer for embedding, loaded on first use
+_model = LazySingleton("sentence_transformer", _load_model)
+
+
+def get_model():
     """
-    Compute cosine similarity between the current query and stored history for a specific user.
+    Get the shared Sentence Transformer model, loading it on first use.
     """
-    query_embedding = model.encode(query).reshape(1, -1)
-    history = get_history(user_id)
-    if not history:
-        return []
+    return _model.get()
+
 
-    embeddings = np.array([np.array(row['embedding']) for row in history])
-    similarities = cosine_similarity(query_embedding, embeddings).flatten()
+def __getattr__(name):
+    # Keep `from helper.similarity import model` working without loading the model at import time
+    if name == "model":
+        return get_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@timed("similarity.compute_similarity")
+def compute_similarity(user_id, query, top_k=5, threshold=0.7):
+    """
+    Find the stored messages most similar to the query for a specific user.
+    :param user_id: User whose history is searched.
+    :param query: Query text.
+    :param top_k: Maximum number of messages returned.
+    :param threshold: Minimum cosine similarity of a returned message.
+    :return: Message rows sorted by decreasing similarity.
+    """
+    query_embedding = get_model().encode(query, normalize_embeddings=True)
+    matches = get_user_index(user_id).search(query_embedding, top_k=top_k, threshold=threshold)
+    if not matches:
+        return []
 
-    # Sort by similarity score
-    similar_items = sorted(zip(history, similarities), key=lambda x: x[1], reverse=True)
-    return [item[0] for item in similar_items if item[1] > 0.7]  # Return only highly similar items
+    return get_messages_by_ids(user_id, [message_id for message_id, _ in matches])
@@ -0,0 +1,314 @@
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+from database import db
+
+# Embedding dimension of all-MiniLM-L6-v2
+EMBEDDING_DIM = 384
+
+# Switch a user's index from exact flat search to HNSW past this many vectors
+HNSW_THRESHOLD = int(os.getenv("VECTOR_INDEX_HNSW_THRESHOLD", "50000"))
+HNSW_NEIGHBORS = 32
+
+# Additions are appended to a log next to the index; the index file is rewritten (and the log
+# emptied) once the log holds this many vectors or this share of the index, whichever is larger
+LOG_MAX_VECTORS = int(os.getenv("VECTOR_INDEX_LOG_MAX_VECTORS", "10000"))
+LOG_MAX_FRACTION = 0.25
+
+# Maximum number of user indexes kept in memory; the least recently used one is saved and dropped
+MAX_CACHED_INDEXES = int(os.getenv("MAX_CACHED_INDEXES", "64"))
+
+# Seconds between checks whether another process (the maintenance rebuild) replaced the index file
+RELOAD_CHECK_INTERVAL = 1.0
+
+
+def get_index_path(user_id):
+    """
+    Path of a user's vector index, stored next to the user's SQLite database.
+    """
+    return os.path.join(db.BASE_DB_DIR, f"{user_id}.faiss")
+
+
+def _log_record_type(dim):
+    """
+    Record of the addition log: a message row id followed by its vector.
+    """
+    return np.dtype([("id", "<i8"), ("vector", "<f4", (dim,))])
+
+
+def read_log(path, dim=EMBEDDING_DIM):
+    """
+    Read the (id, vector) records of an addition log, ignoring a record cut short by a crash.
+    """
+    record_type = _log_record_type(dim)
+    if not os.path.exists(path):
+        return np.empty(0, dtype=record_type)
+    with open(path, "rb") as file:
+        data = file.read()
+    return np.frombuffer(data, dtype=record_type, count=len(data) // record_type.itemsize)
+
+
+def _as_matrix(vectors):
+    """
+    Convert vectors to a contiguous float32 matrix normalized to unit length,
+    so inner product equals cosine similarity.
+    """
+    matrix = np.ascontiguousarray(np.atleast_2d(np.asarray(vectors, dtype=np.float32)))
+    faiss.normalize_L2(matrix)
+    return matrix
+
+
+class UserVectorIndex:
+    def __init__(self, user_id, dim=EMBEDDING_DIM, hnsw_threshold=HNSW_THRESHOLD, load=True):
+        """
+        Initialize the vector index of a user, loading it memory-mapped if it exists on disk,
+        then replaying the additions logged since it was last written.
+        :param user_id: User whose messages are indexed.
+        :param dim: Dimension of the embeddings.
+        :param hnsw_threshold: Number of vectors past which the flat index is rebuilt as HNSW.
+        :param load: Start from the index on disk, and reload it when another process replaces it;
+            rebuilds pass False to start empty.
+        """
+        self.user_id = user_id
+        self.dim = dim
+        self.hnsw_threshold = hnsw_threshold
+        self.path = get_index_path(user_id)
+        self.log_path = f"{self.path}.log"
+        self._lock = threading.Lock()
+        self._logged = 0  # Vectors in the log, not in the index file yet
+        self._unsaved = 0  # Vectors added without the log, only persisted by save()
+        self._mmapped = False
+        self._follows_file = load
+        self._signature = None  # Identity of the index file this index was loaded from or saved to
+        self._checked_at = time.monotonic()
+
+        if load:
+            self._load()
+        else:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        """
+        Load the index file memory-mapped, or start empty, then replay the addition log.
+        """
+        self._signature = self._file_signature()
+        if self._signature is not None:
+            self.index = faiss.read_index(self.path, faiss.IO_FLAG_MMAP)
+            self._mmapped = True
+        else:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+            self._mmapped = False
+        self._logged = 0
+        self._unsaved = 0
+        self._replay_log()
+
+    def _reload_if_replaced_locked(self, force=False):
+        """
+        Reload the index when another process replaced its file, e.g. `database.maintenance`
+        rebuilding it, instead of overwriting the rebuilt file at the next save.
+        Checked at most every RELOAD_CHECK_INTERVAL seconds unless forced.
+        """
+        if not self._follows_file:
+            return
+        now = time.monotonic()
+        if not force and now - self._checked_at < RELOAD_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        signature = self._file_signature()
+        if signature is not None and signature != self._signature:
+            print(f"Vector index of {self.user_id} was replaced on disk, reloading it.")
+            self._load()
+
+    def __len__(self):
+        return self.index.ntotal
+
+    @property
+    def kind(self):
+        """
+        Name of the underlying index type ("flat" or "hnsw").
+        """
+        inner = faiss.downcast_index(self.index.index)
+        return "hnsw" if isinstance(inner, faiss.IndexHNSW) else "flat"
+
+    def _ensure_writable(self):
+        """
+        Replace a memory-mapped index with an in-memory copy before modifying it.
+        """
+        if self._mmapped:
+            self.index = faiss.read_index(self.path)
+            self._mmapped = False
+
+    def _upgrade_to_hnsw(self):
+        """
+        Rebuild the flat index as an HNSW index once it is large enough.
+        """
+        flat = faiss.downcast_index(self.index.index)
+        vectors = flat.reconstruct_n(0, self.index.ntotal)
+        ids = faiss.vector_to_array(self.index.id_map).astype(np.int64)
+
+        hnsw = faiss.IndexIDMap2(faiss.IndexHNSWFlat(self.dim, HNSW_NEIGHBORS, faiss.METRIC_INNER_PRODUCT))
+        hnsw.add_with_ids(vectors, ids)
+        self.index = hnsw
+
+    def _replay_log(self):
+        """
+        Add the logged vectors missing from the index (all of them, unless a crash interrupted
+        a save between writing the index and deleting the log).
+        """
+        records = read_log(self.log_path, self.dim)
+        if not len(records):
+            return
+        self._ensure_writable()
+        present = set(faiss.vector_to_array(self.index.id_map).tolist()) if self.index.ntotal else set()
+        missing = records[[int(message_id) not in present for message_id in records["id"]]]
+        if len(missing):
+            self.index.add_with_ids(np.ascontiguousarray(missing["vector"]), np.ascontiguousarray(missing["id"]))
+            if self.kind == "flat" and self.index.ntotal >= self.hnsw_threshold:
+                self._upgrade_to_hnsw()
+        self._logged = len(records)
+
+    def _append_log(self, ids, matrix):
+        records = np.empty(len(ids), dtype=_log_record_type(self.dim))
+        records["id"] = ids
+        records["vector"] = matrix
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+        with open(self.log_path, "ab") as file:
+            file.write(records.tobytes())
+
+    def add(self, ids, vectors, persist=True):
+        """
+        Add embeddings for message row ids to the index.
+        :param persist: Append the vectors to the log, which costs O(len(ids)) writes; the index file
+            is only rewritten when the log grows past its limit. Bulk rebuilds pass False and
+            call save() once at the end.
+        """
+        matrix = _as_matrix(vectors)
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            self._reload_if_replaced_locked()
+            self._ensure_writable()
+            self.index.add_with_ids(matrix, ids)
+            if self.kind == "flat" and self.index.ntotal >= self.hnsw_threshold:
+                self._upgrade_to_hnsw()
+            if not persist:
+                self._unsaved += len(ids)
+                return
+            self._append_log(ids, matrix)
+            self._logged += len(ids)
+            if self._logged >= max(LOG_MAX_VECTORS, LOG_MAX_FRACTION * self.index.ntotal):
+                self._save_locked()
+
+    def remove(self, ids):
+        """
+        Remove the vectors of message row ids. The index is written right away, since the log
+        only records additions.
+        :return: Number of vectors removed.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            self._reload_if_replaced_locked(force=True)
+            if self.index.ntotal == 0:
+                return 0
+            self._ensure_writable()
+            if self.kind == "flat":
+                removed = self.index.remove_ids(ids)
+            else:
+                # HNSW graphs do not support removal: rebuild the index without the removed vectors
+                stored = faiss.vector_to_array(self.index.id_map).astype(np.int64)
+                keep = ~np.isin(stored, ids)
+                removed = int(len(stored) - keep.sum())
+                if removed:
+                    vectors = faiss.downcast_index(self.index.index).reconstruct_n(0, self.index.ntotal)
+                    hnsw = faiss.IndexIDMap2(faiss.IndexHNSWFlat(self.dim, HNSW_NEIGHBORS, faiss.METRIC_INNER_PRODUCT))
+                    hnsw.add_with_ids(np.ascontiguousarray(vectors[keep]), stored[keep])
+                    self.index = hnsw
+            if removed:
+                self._save_locked()
+            return removed
+
+    def search(self, vector, top_k=5, threshold=0.0):
+        """
+        Return (message id, score) pairs of the top_k most similar vectors above the threshold.
+        """
+        with self._lock:
+            self._reload_if_replaced_locked()
+            if self.index.ntotal == 0:
+                return []
+            scores, ids = self.index.search(_as_matrix(vector), min(top_k, self.index.ntotal))
+        return [
+            (int(message_id), float(score))
+            for message_id, score in zip(ids[0], scores[0])
+            if message_id != -1 and score >= threshold
+        ]
+
+    def _save_locked(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        faiss.write_index(self.index, temp_path)
+        os.replace(temp_path, self.path)
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self._signature = self._file_signature()
+        self._logged = 0
+        self._unsaved = 0
+
+    def save(self, force=False):
+        """
+        Write the index to disk if it has additions that are not in the log.
+        Logged additions are replayed on load, so they need no rewrite of the index file.
+        An index whose file was replaced by another process is reloaded instead of written.
+        :param force: Write the index (and empty the log) even without such additions, e.g. after a rebuild.
+        """
+        with self._lock:
+            self._reload_if_replaced_locked(force=True)
+            if self._unsaved or force:
+                self._save_locked()
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_user_index(user_id):
+    """
+    Get the shared vector index of a user, loading it on first use.
+    At most MAX_CACHED_INDEXES indexes stay loaded; evicted ones are saved first.
+    """
+    evicted = []
+    with _indexes_lock:
+        index = _indexes.get(user_id)
+        if index is not None:
+            _indexes.move_to_end(user_id)
+            return index
+        index = _indexes[user_id] = UserVectorIndex(user_id)
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            evicted.append(_indexes.popitem(last=False)[1])
+    for evicted_index in evicted:
+        evicted_index.save()
+    return index
+
+
+def save_all_indexes():
+    """
+    Persist every loaded index with additions that are not in its log.
+    """
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        index.save()
+
+
+atexit.register(save_all_indexes)
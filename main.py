@@ -1,46 +1,85 @@
 import os
-from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 from database.db import (
-    add_message,
-    get_chat_history,
+    add_messages,
     authenticate_user,
     initialize_user_database,
-    get_all_chat_ids,  # Helper to fetch all chat IDs
+    iter_recent_messages_by_chat,  # Helper to stream the tail of every chat
 )
-from agents.GoogleSearch import academic_search_agent
+from agents.GoogleSearch import academic_search_agent, academic_search_agent_stream
 from agents.VideoSearch import video_search_agent 
+from helper.context_builder import build_context, register_summary_listener
+from helper.embedding_pipeline import register_embedding_listener
+from helper.metrics import profile_slow, span, start_exporters
+
+# Agents that can stream their response token by token
+STREAMING_AGENTS = {academic_search_agent: academic_search_agent_stream}
+
+
+def print_streamed_response(chunks, stats):
+    """
+    Print response chunks as they arrive and collect the full response.
+    Ctrl+C stops the stream and keeps what was received so far.
+    :return: (response, metadata) where metadata records partial responses and stream metrics.
+    """
+    received = []
+    partial = False
+    try:
+        for chunk in chunks:
+            if not received:
+                print("Agent: ", end="")
+            received.append(chunk)
+            print(chunk, end="", flush=True)
+    except KeyboardInterrupt:
+        partial = True
+        chunks.close()
+        print(" [cancelled]", end="")
+    print()
+
+    metadata = {
+        "partial": partial or stats.get("completed") is False,
+        "time_to_first_token": stats.get("time_to_first_token"),
+        "tokens_per_sec": stats.get("tokens_per_sec"),
+    }
+    return "".join(received), metadata
 
 def fetch_all_contexts(user_id):
     """
-    Fetch all chat contexts for the user.
+    Stream all chat contexts for the user, one chat at a time.
+    The last messages of every chat are read in a single database query.
     """
-    chat_ids = get_all_chat_ids(user_id)  # Get all chat IDs for the user
-    if not chat_ids:
-        return "No chats found for this user."
+    found = False
+    for chat_id, chat_history in iter_recent_messages_by_chat(user_id, limit=5):
+        found = True
+        yield f"Chat ID: {chat_id}\n{format_chat_context(chat_history)}\n"
 
-    history = []
-    for chat_id in chat_ids:
-        context = fetch_context_from_history(user_id, chat_id)
-        history.append(f"Chat ID: {chat_id}\n{context}\n")
-    return "\n".join(history)
+    if not found:
+        yield "No chats found for this user."
 
 
 def fetch_context_from_history(user_id, chat_id):
     """
-    Fetch recent chat history to determine the context for the agent.
+    Fetch the chat context for the agent: the chat's rolling summary and its recent messages,
+    within the context token budget.
     """
-    chat_history = get_chat_history(user_id, chat_id)
-    if not chat_history:
+    context = build_context(user_id, chat_id)
+    if not context:
         return "No prior context available."
 
+    return context
+
+
+def format_chat_context(chat_history):
+    """
+    Format chat messages as "Role: content" lines.
+    """
     # Map SQLAlchemy rows to dictionary-like access or access by tuple index
     return "\n".join(
         [
             f"{msg.role.capitalize()}: {msg.content}"
             if hasattr(msg, "role")
             else f"{msg[4].capitalize()}: {msg[1]}"
-            for msg in chat_history[-5:]
+            for msg in chat_history
         ]
     )
 
@@ -50,6 +89,9 @@ def main():
     Main entry point for managing users, their databases, and chat interactions.
     """
     print("Welcome to the Chat System!")
+    start_exporters()  # Metrics endpoint / JSON export, when configured
+    register_embedding_listener()  # Embed and index stored messages in the background
+    register_summary_listener()  # Keep rolling chat summaries up to date
     
     # Authenticate user
     user_id = authenticate_user()  # Use `user_id` directly
@@ -77,7 +119,8 @@ def main():
 
         elif chat_id_or_action == "2":
             print("\nAll Chat Histories:")
-            print(fetch_all_contexts(user_id))  # Fetch and display all chat histories
+            for context in fetch_all_contexts(user_id):  # Stream and display all chat histories
+                print(context)
             continue  # Restart the loop to show the main options again
 
         else:
@@ -139,35 +182,45 @@ def main():
                 print("Message cannot be empty. Please try again.")
                 continue
 
-            # Save user message to chat history
-            try:
-                add_message(
-                    user_id=user_id,
-                    chat_id=chat_id,
-                    message_id=f"{chat_id}_msg_{datetime.now().strftime('%Y%m%d%H%M%S')}",
-                    content=user_message,
-                    role="user",
-                )
-            except IntegrityError as e:
-                print(f"Error saving message: {e}")
-                continue
+            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+            turn_messages = [{
+                "chat_id": chat_id,
+                "message_id": f"{chat_id}_msg_{timestamp}",
+                "content": user_message,
+                "role": "user",
+            }]
 
             # Process the message using the current agent
-            response = current_agent(user_id, chat_id, user_message)
-            print(f"Agent: {response}")
-
-            # Save agent response to chat history
+            response_metadata = None
+            stream_agent = STREAMING_AGENTS.get(current_agent)
             try:
-                add_message(
-                    user_id=user_id,
-                    chat_id=chat_id,
-                    message_id=f"{chat_id}_response_{datetime.now().strftime('%Y%m%d%H%M%S')}",
-                    content=response,
-                    role="assistant",
-                )
-            except IntegrityError as e:
-                print(f"Error saving response: {e}")
-                continue
+                # Pipeline stages are profiled on their own threads; this profiles the work done on this
+                # thread, e.g. streaming the LLM response
+                with span(f"turn.{agent_name}"), profile_slow(f"turn-{agent_name}"):
+                    if stream_agent:
+                        stats = {}
+                        response, response_metadata = print_streamed_response(
+                            stream_agent(user_id, chat_id, user_message, stats=stats), stats
+                        )
+                    else:
+                        response = current_agent(user_id, chat_id, user_message)
+                        print(f"Agent: {response}")
+            except BaseException:
+                # The agent failed or was interrupted (Ctrl+C): keep the user's message
+                add_messages(user_id, turn_messages)
+                raise
+
+            # Save the user message and the agent response to chat history in one commit
+            if response:
+                turn_messages.append({
+                    "chat_id": chat_id,
+                    "message_id": f"{chat_id}_response_{timestamp}",
+                    "content": response,
+                    "role": "assistant",
+                    "metadata": response_metadata,
+                })
+            if not add_messages(user_id, turn_messages):
+                print("Error saving messages to chat history.")
 
         # Optionally, confirm if the user wants another session
         continue_chat = input("\nDo you want to start another chat? (yes/no): ").strip().lower()
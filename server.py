@@ -0,0 +1,266 @@
+import argparse
+import asyncio
+import functools
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from aiohttp import web
+
+from database.db import (
+    add_messages, create_user, get_recent_messages, get_storage_backend, verify_user,
+)
+from database.credentials import credential_store
+from database.write_behind import get_write_behind_writer
+from agents.GoogleSearch import academic_search_agent
+from agents.VideoSearch import video_search_agent
+from helper.context_builder import register_summary_listener
+from helper.embedding_pipeline import register_embedding_listener
+from helper.lazy import warm_up
+from helper.metrics import metrics, span, start_exporters
+from helper.search_cache import search_cache
+
+# Server configuration
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "32"))  # Threads running agents (search + LLM)
+DB_WORKERS = int(os.getenv("DB_WORKERS", "8"))  # Threads running database calls
+PER_USER_CONCURRENCY = int(os.getenv("PER_USER_CONCURRENCY", "2"))  # Turns in flight per user
+# Group-commit chat messages in the background instead of committing each turn before replying
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "").lower() in ("1", "true", "yes")
+
+# Lazy singletons loaded by --warm-up; the LLM client is loaded by the backend's preload()
+WARM_UP_SINGLETONS = ("sentence_transformer", "llm_backend")
+
+AGENTS = {
+    "academic": academic_search_agent,
+    "video": video_search_agent,
+}
+
+
+class ChatServer:
+    def __init__(self, agents=AGENTS, agent_workers=AGENT_WORKERS, db_workers=DB_WORKERS,
+                 per_user_concurrency=PER_USER_CONCURRENCY, write_behind=WRITE_BEHIND):
+        """
+        Initialize an asyncio chat server serving many users from one process.
+        Blocking agent and database calls run in bounded thread pools.
+        :param agents: Mapping of agent name to agent function (user_id, chat_id, query) -> response.
+        :param agent_workers: Size of the thread pool running agents.
+        :param db_workers: Size of the thread pool running database calls.
+        :param per_user_concurrency: Maximum number of turns a user may have in flight.
+        :param write_behind: Reply before the turn's messages are committed; they are group-committed
+                             by the write-behind writer (see database/write_behind.py for durability).
+        """
+        self.agents = agents
+        self.per_user_concurrency = per_user_concurrency
+        self.agent_executor = ThreadPoolExecutor(max_workers=agent_workers, thread_name_prefix="agent")
+        self.db_executor = ThreadPoolExecutor(max_workers=db_workers, thread_name_prefix="db")
+        self.writer = get_write_behind_writer() if write_behind else None
+        self._tokens = {}  # Session token -> user_id
+        self._user_turns = {}  # user_id -> semaphore limiting concurrent turns
+        self.turns = 0
+        self.rejected = 0
+
+    async def _run(self, executor, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+    async def run_db(self, func, *args, **kwargs):
+        """
+        Run a blocking database call in the database thread pool.
+        """
+        return await self._run(self.db_executor, func, *args, **kwargs)
+
+    async def run_agent(self, func, *args, **kwargs):
+        """
+        Run a blocking agent call in the agent thread pool.
+        """
+        return await self._run(self.agent_executor, func, *args, **kwargs)
+
+    def _authenticated_user(self, request):
+        header = request.headers.get("Authorization", "")
+        user_id = self._tokens.get(header.removeprefix("Bearer ").strip())
+        if user_id is None:
+            raise web.HTTPUnauthorized(text="Missing or invalid session token.")
+        return user_id
+
+    async def _read_json(self, request, *fields):
+        try:
+            body = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text="Request body must be JSON.")
+        if not isinstance(body, dict):
+            raise web.HTTPBadRequest(text="Request body must be a JSON object.")
+        not_strings = [field for field in fields if not isinstance(body.get(field, ""), str)]
+        if not_strings:
+            raise web.HTTPBadRequest(text=f"Fields must be strings: {', '.join(not_strings)}")
+        missing = [field for field in fields if not body.get(field, "").strip()]
+        if missing:
+            raise web.HTTPBadRequest(text=f"Missing fields: {', '.join(missing)}")
+        return body
+
+    def _new_session(self, user_id):
+        token = secrets.token_urlsafe(32)
+        self._tokens[token] = user_id
+        return web.json_response({"user_id": user_id, "token": token})
+
+    async def signup(self, request):
+        body = await self._read_json(request, "username", "password")
+        username, password = body["username"].strip(), body["password"].strip()
+        # Account creation is a single atomic insert, so concurrent signups need no lock
+        try:
+            created = await self.run_db(create_user, username, password)
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        if not created:
+            raise web.HTTPConflict(text=f"Username '{username}' already exists.")
+        return self._new_session(username)
+
+    async def login(self, request):
+        body = await self._read_json(request, "username", "password")
+        username, password = body["username"].strip(), body["password"].strip()
+        if not await self.run_db(verify_user, username, password):
+            raise web.HTTPUnauthorized(text="Incorrect username or password.")
+        return self._new_session(username)
+
+    async def chat(self, request):
+        user_id = self._authenticated_user(request)
+        body = await self._read_json(request, "chat_id", "message")
+        agent_name = body.get("agent", "academic")
+        agent = self.agents.get(agent_name) if isinstance(agent_name, str) else None
+        if agent is None:
+            raise web.HTTPBadRequest(text=f"Unknown agent, expected one of {sorted(self.agents)}")
+        chat_id, user_message = body["chat_id"].strip(), body["message"].strip()
+
+        turns = self._user_turns.setdefault(user_id, asyncio.Semaphore(self.per_user_concurrency))
+        if turns.locked():
+            self.rejected += 1
+            raise web.HTTPTooManyRequests(text="Too many turns in flight for this user.")
+
+        async with turns:
+            start = time.perf_counter()
+            timestamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
+            response = await self.run_agent(self._run_turn, agent_name, agent, user_id, chat_id, user_message)
+            await self._save_turn(user_id, [
+                {"chat_id": chat_id, "message_id": f"{chat_id}_msg_{timestamp}", "content": user_message, "role": "user"},
+                {"chat_id": chat_id, "message_id": f"{chat_id}_response_{timestamp}", "content": response,
+                 "role": "assistant"},
+            ])
+            self.turns += 1
+            return web.json_response({"response": response, "latency": time.perf_counter() - start})
+
+    async def _save_turn(self, user_id, turn_messages):
+        """
+        Store the messages of a turn in one commit, or queue them for the write-behind writer.
+        """
+        if self.writer is not None:
+            future = self.writer.submit_many(user_id, turn_messages)
+            future.add_done_callback(functools.partial(self._report_write_behind, user_id))
+        else:
+            await self.run_db(add_messages, user_id, turn_messages)
+
+    @staticmethod
+    def _report_write_behind(user_id, future):
+        """
+        Log a turn whose group commit failed; nobody waits on the write-behind Future.
+        """
+        error = future.exception()
+        if error is not None:
+            print(f"Error saving turn of user {user_id}: {error}")
+        elif not future.result():
+            print(f"Turn of user {user_id} was not saved: a message was rejected by the database.")
+
+    def _run_turn(self, agent_name, agent, user_id, chat_id, user_message):
+        # Slow stages are profiled by the agent pipelines on the threads running them
+        with span(f"turn.{agent_name}"):
+            return agent(user_id, chat_id, user_message)
+
+    async def history(self, request):
+        user_id = self._authenticated_user(request)
+        chat_id = request.query.get("chat_id")
+        if not chat_id:
+            raise web.HTTPBadRequest(text="Missing chat_id.")
+        limit = request.query.get("limit", "5")
+        if not limit.isdigit() or int(limit) < 1:
+            raise web.HTTPBadRequest(text="limit must be a positive integer.")
+        limit = int(limit)
+        rows = await self.run_db(get_recent_messages, user_id, chat_id, limit=limit)
+        return web.json_response([{"role": row.role, "content": row.content} for row in rows])
+
+    async def stats(self, request):
+        return web.json_response({
+            "turns": self.turns,
+            "rejected": self.rejected,
+            "sessions": len(self._tokens),
+            "storage": get_storage_backend().stats(),
+            "credentials": credential_store.stats(),
+            "search_cache": search_cache.stats(),
+            "write_behind": {
+                "pending": self.writer.pending(),
+                "commits": self.writer.commits,
+                "committed": self.writer.committed,
+            } if self.writer is not None else None,
+        })
+
+    async def metrics(self, request):
+        return web.Response(text=metrics.to_prometheus(), content_type="text/plain")
+
+    async def _shutdown(self, app):
+        self.agent_executor.shutdown(wait=True)
+        if self.writer is not None:
+            await self.run_db(self.writer.flush)
+        self.db_executor.shutdown(wait=True)
+
+    def build_app(self):
+        """
+        Build the aiohttp application exposing the chat API.
+        """
+        app = web.Application()
+        app.add_routes([
+            web.post("/signup", self.signup),
+            web.post("/login", self.login),
+            web.post("/chat", self.chat),
+            web.get("/history", self.history),
+            web.get("/stats", self.stats),
+            web.get("/metrics", self.metrics),
+        ])
+        app.on_cleanup.append(self._shutdown)
+        return app
+
+
+def warm_up_server():
+    """
+    Load the embedding model and the configured LLM backend before the first request.
+    :return: Names of what was loaded.
+    """
+    import helper.similarity  # noqa: F401  Registers the embedding model, which the server imports lazily
+    from helper.ollama import LLM_BACKEND, get_llm_backend
+
+    loaded = warm_up(WARM_UP_SINGLETONS)
+    try:
+        get_llm_backend().preload()
+        loaded.append(f"{LLM_BACKEND} model")
+    except Exception as e:
+        print(f"Could not preload the {LLM_BACKEND} backend: {e}")
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the chat agents over HTTP.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--warm-up", action="store_true", help="Load lazy models and clients before serving")
+    args = parser.parse_args()
+
+    start_exporters()  # Extra metrics endpoint / JSON export, when configured
+    register_embedding_listener()  # Embed and index stored messages in the background
+    register_summary_listener()  # Keep rolling chat summaries up to date
+    if args.warm_up:
+        print(f"Warmed up: {', '.join(warm_up_server())}")
+    web.run_app(ChatServer().build_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import pytest
+
+from database import db
+
+
+@pytest.fixture
+def per_user_storage(tmp_path, monkeypatch):
+    """
+    Per-user SQLite storage in a temporary directory, with no message listeners registered.
+    """
+    monkeypatch.setattr(db, "BASE_DB_DIR", str(tmp_path / "user_databases"))
+    monkeypatch.setattr(db, "message_listeners", [])
+    storage = db.PerUserStorage(db.EngineRegistry())
+    previous = db.set_storage_backend(storage)
+    yield storage
+    db.set_storage_backend(previous)
+    storage.dispose()
+
+
+@pytest.fixture
+def shared_storage(tmp_path, monkeypatch):
+    """
+    Shared-layout storage in a temporary SQLite file, with no message listeners registered.
+    """
+    monkeypatch.setattr(db, "BASE_DB_DIR", str(tmp_path / "user_databases"))
+    monkeypatch.setattr(db, "message_listeners", [])
+    storage = db.SharedStorage(f"sqlite:///{tmp_path / 'shared.db'}")
+    previous = db.set_storage_backend(storage)
+    yield storage
+    db.set_storage_backend(previous)
+    storage.dispose()
@@ -0,0 +1,85 @@
+import http.server
+import threading
+import time
+
+import pytest
+
+from helper import enrichment
+
+
+class PageHandler(http.server.BaseHTTPRequestHandler):
+    redirect_to = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", self.redirect_to)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.end_headers()
+        if self.path != "/slow":
+            self.wfile.write(b"<p>graph neural networks</p>" * 50)
+            return
+        # Large chunks with little text, so that only the deadline stops reading early
+        for _ in range(5):
+            self.wfile.write(b"<p>graph neural networks</p><script>" + b" " * 20000 + b"</script>")
+            self.wfile.flush()
+            time.sleep(0.1)
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(address="127.0.0.1"):
+        server = http.server.ThreadingHTTPServer((address, 0), PageHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://{address}:{server.server_port}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def empty_page_cache():
+    enrichment.page_cache.clear()
+
+
+def test_non_public_addresses_are_refused(serve):
+    url = serve()
+
+    assert enrichment.fetch_page_text(f"{url}/page") == ""
+    assert enrichment.fetch_page_text(url.replace("127.0.0.1", "localhost") + "/page") == ""
+
+
+def test_redirects_are_checked_on_the_connected_address(serve, monkeypatch):
+    # 127.0.0.1 stands for a public host, 127.0.0.2 for an internal one
+    monkeypatch.setattr(enrichment, "is_public_address", lambda address: address == "127.0.0.1")
+    public, internal = serve("127.0.0.1"), serve("127.0.0.2")
+    monkeypatch.setattr(PageHandler, "redirect_to", f"{internal}/page")
+
+    assert "graph neural networks" in enrichment.fetch_page_text(f"{public}/page")
+    assert enrichment.fetch_page_text(f"{internal}/page") == ""
+    assert enrichment.fetch_page_text(f"{public}/redirect") == ""
+
+
+def test_pages_cut_short_by_the_deadline_are_not_cached(serve, monkeypatch):
+    monkeypatch.setattr(enrichment, "ENRICH_ALLOW_PRIVATE", True)
+    url = f"{serve()}/slow"
+
+    partial = enrichment.cached_page_text(url, time.monotonic() + 0.15)
+    assert partial.startswith("graph neural networks")
+    assert enrichment.page_cache.stats()["entries"] == 0
+
+    complete = enrichment.cached_page_text(url, time.monotonic() + 5)
+    assert len(complete) > len(partial)
+    assert enrichment.page_cache.stats()["entries"] == 1
+    assert enrichment.cached_page_text(url) == complete
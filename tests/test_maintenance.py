@@ -0,0 +1,73 @@
+import pytest
+
+from database import db
+from database.maintenance import compact_user, find_old_chats
+
+
+@pytest.fixture
+def compact(per_user_storage, tmp_path):
+    """
+    compact_user opens the databases through the module's engine registry, as in a worker process.
+    """
+    def run(user_id, **options):
+        try:
+            return compact_user(user_id, archive_dir=str(tmp_path / "archives"), **options)
+        finally:
+            db.engine_registry.dispose()
+
+    per_user_storage.dispose()
+    return run
+
+
+def add_chat(user_id, chat_id, count):
+    db.add_messages(user_id, [
+        {"chat_id": chat_id, "message_id": f"{chat_id}_{i}", "content": f"{chat_id} {i}", "role": "user"}
+        for i in range(count)
+    ])
+
+
+def set_created_at(storage, user_id, chat_id, created_at):
+    with storage.engine(user_id).begin() as connection:
+        connection.execute(db.chats.update().where(db.chats.c.id == chat_id).values(createdAt=created_at))
+
+
+def test_first_message_creates_the_chats_row(per_user_storage):
+    add_chat("alice", "chat", 2)
+    add_chat("alice", "chat", 1)
+
+    with per_user_storage.engine("alice").connect() as connection:
+        rows = connection.execute(db.chats.select()).all()
+    assert [(row.id, row.title, row.summarizedUpTo) for row in rows] == [("chat", "chat 0", 0)]
+    assert db.get_chat_summary("alice", "chat") == (None, 0)
+
+
+def test_new_unsummarized_chats_are_not_old(per_user_storage, compact):
+    add_chat("alice", "first", 3)
+    add_chat("alice", "second", 3)
+
+    stats = compact("alice", keep_chats=1, older_than_days=90)
+
+    assert stats["chats"] == 0
+    assert sorted(db.get_all_chat_ids("alice")) == ["first", "second"]
+
+
+def test_chats_created_before_the_cutoff_are_archived(per_user_storage, compact):
+    add_chat("alice", "old", 3)
+    add_chat("alice", "new", 3)
+    set_created_at(per_user_storage, "alice", "old", "2000-01-01T00:00:00")
+
+    stats = compact("alice", keep_chats=0, older_than_days=90)
+
+    assert stats["chats"] == 1 and stats["messages"] == 3
+    assert db.get_all_chat_ids("alice") == ["new"]
+
+
+def test_chats_without_a_chats_row_have_no_age(per_user_storage):
+    add_chat("alice", "legacy", 2)
+    add_chat("alice", "recent", 2)
+    with per_user_storage.engine("alice").begin() as connection:
+        connection.execute(db.chats.delete().where(db.chats.c.id == "legacy"))
+
+    with per_user_storage.engine("alice").connect() as connection:
+        assert find_old_chats(connection, keep_chats=1, older_than_days=90) == []
+        assert find_old_chats(connection, keep_chats=1) == ["legacy"]
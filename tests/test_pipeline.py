@@ -0,0 +1,79 @@
+import threading
+import time
+
+from agents.pipeline import Pipeline, Stage, StageFailed
+
+
+def test_stages_run_after_their_dependencies():
+    pipeline = Pipeline("test", [
+        Stage("a", lambda ctx: ctx["x"] + 1),
+        Stage("b", lambda ctx: ctx["a"] * 2, depends_on=("a",)),
+    ])
+
+    result = pipeline.run(x=1)
+
+    assert result.error is None and result["b"] == 4
+    assert set(result.timings) == {"a", "b"}
+
+
+def test_failed_stage_stops_the_run():
+    def fail(ctx):
+        raise StageFailed("No results.")
+
+    result = Pipeline("test", [Stage("a", fail), Stage("b", lambda ctx: 1, depends_on=("a",))]).run()
+
+    assert result.error == "No results." and "b" not in result.context
+
+
+def test_timed_out_stage_finishes_after_the_run_without_errors(monkeypatch):
+    errors = []
+    finished = threading.Event()
+    timed = Pipeline._timed
+
+    def recording_timed(self, *args):
+        try:
+            return timed(self, *args)
+        except Exception as e:
+            errors.append(e)
+            raise
+        finally:
+            finished.set()
+
+    def slow(ctx):
+        time.sleep(0.3)
+        return "late"
+
+    monkeypatch.setattr(Pipeline, "_timed", recording_timed)
+    result = Pipeline("test", [Stage("slow", slow, timeout=0.05)]).run()
+
+    assert result.error == "Stage 'slow' timed out after 0.05s"
+    assert result.timings == {"slow": 0.05}
+    assert finished.wait(2) and errors == []
+    assert result.timings == {"slow": 0.05}
+
+
+def test_optional_stage_that_times_out_gives_its_default():
+    def slow(ctx):
+        time.sleep(0.3)
+        return ["late"]
+
+    result = Pipeline("test", [
+        Stage("related", slow, timeout=0.05, optional=True, default=[]),
+        Stage("prompt", lambda ctx: f"related={ctx['related']}", depends_on=("related",)),
+    ]).run()
+
+    assert result.error is None
+    assert result["prompt"] == "related=[]"
+    assert result.timings["related"] == 0.05
+
+
+def test_optional_stage_that_fails_gives_its_default():
+    def fail(ctx):
+        raise RuntimeError("index unavailable")
+
+    result = Pipeline("test", [
+        Stage("related", fail, optional=True, default=[]),
+        Stage("prompt", lambda ctx: len(ctx["related"]), depends_on=("related",)),
+    ]).run()
+
+    assert result.error is None and result["prompt"] == 0
@@ -0,0 +1,146 @@
+import numpy as np
+
+from helper import semantic_cache
+from helper.semantic_cache import SemanticCache, cached_query, cached_stream
+
+# Unit vectors of the prompts used below: "paper" and "papers" are near-duplicates (cosine 0.96)
+VECTORS = {
+    "paper": [1.0, 0.0, 0.0],
+    "papers": [0.96, 0.28, 0.0],
+    "video": [0.0, 1.0, 0.0],
+    "music": [0.0, 0.0, 1.0],
+}
+
+
+def fake_embed(texts):
+    return np.array([VECTORS[text] for text in texts], dtype=np.float32)
+
+
+class FakeLLM:
+    """
+    Stand-in LLM returning a numbered completion per call.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, prompt, model=None):
+        self.calls.append(prompt)
+        return f"answer {len(self.calls)} to {prompt}"
+
+
+def make_cache(**options):
+    return SemanticCache(embed=fake_embed, **dict({"threshold": 0.92, "ttl": 60, "max_entries": 10}, **options))
+
+
+def test_near_duplicate_above_threshold_hits():
+    cache, llm = make_cache(), FakeLLM()
+
+    first = cached_query("paper", "academic", llm=llm, cache=cache, enabled=True)
+    second = cached_query("papers", "academic", llm=llm, cache=cache, enabled=True)
+
+    assert second == first
+    assert llm.calls == ["paper"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_prompt_below_threshold_misses():
+    cache, llm = make_cache(threshold=0.97), FakeLLM()
+
+    cached_query("paper", "academic", llm=llm, cache=cache, enabled=True)
+    cached_query("papers", "academic", llm=llm, cache=cache, enabled=True)
+
+    assert llm.calls == ["paper", "papers"]
+    assert cache.stats()["misses"] == 2
+
+
+def test_disabled_cache_always_calls_llm():
+    cache, llm = make_cache(), FakeLLM()
+
+    cached_query("paper", "academic", llm=llm, cache=cache, enabled=False)
+    cached_query("paper", "academic", llm=llm, cache=cache, enabled=False)
+
+    assert llm.calls == ["paper", "paper"]
+    assert cache.stats()["namespaces"] == {}
+
+
+def test_namespaces_and_models_are_separate():
+    cache, llm = make_cache(), FakeLLM()
+
+    cached_query("paper", "academic", llm=llm, cache=cache, enabled=True)
+    cached_query("paper", "video", llm=llm, cache=cache, enabled=True)
+    cached_query("paper", "academic", llm=llm, cache=cache, enabled=True, model="other")
+
+    assert len(llm.calls) == 3
+
+
+def test_expired_entries_are_not_returned(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(semantic_cache.time, "time", lambda: now[0])
+    cache, llm = make_cache(ttl=10), FakeLLM()
+
+    cached_query("paper", "academic", llm=llm, cache=cache, enabled=True)
+    now[0] += 5
+    cached_query("paper", "academic", llm=llm, cache=cache, enabled=True)
+    now[0] += 10
+    cached_query("papers", "academic", llm=llm, cache=cache, enabled=True)
+
+    assert llm.calls == ["paper", "papers"]
+
+
+def test_lru_eviction_is_per_namespace():
+    cache = make_cache(max_entries=2)
+    cache.store("academic", "paper", "a")
+    cache.store("academic", "video", "b")
+    cache.store("other", "music", "c")
+    assert cache.lookup("academic", "paper") == "a"  # "video" is now the least recently used
+
+    cache.store("academic", "music", "d")
+
+    assert cache.lookup("academic", "video") is None
+    assert cache.lookup("academic", "paper") == "a"
+    assert cache.lookup("other", "music") == "c"
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["namespaces"] == {"academic": 2, "other": 1}
+
+
+def fake_stream(chunks, completed):
+    calls = []
+
+    def stream(prompt, model=None, stats=None):
+        calls.append(prompt)
+        stats["completed"] = False
+        yield from chunks
+        stats["completed"] = completed
+
+    return stream, calls
+
+
+def test_completed_stream_is_cached_and_replayed():
+    cache = make_cache()
+    stream, calls = fake_stream(["Hello", " world"], completed=True)
+
+    assert list(cached_stream("paper", "academic", stream_llm=stream, cache=cache, enabled=True)) == ["Hello", " world"]
+    assert list(cached_stream("papers", "academic", stream_llm=stream, cache=cache, enabled=True)) == ["Hello world"]
+    assert calls == ["paper"]
+
+
+def test_partial_stream_is_not_cached():
+    cache = make_cache()
+    stream, calls = fake_stream(["Hel"], completed=False)
+
+    assert list(cached_stream("paper", "academic", stream_llm=stream, cache=cache, enabled=True)) == ["Hel"]
+    assert list(cached_stream("paper", "academic", stream_llm=stream, cache=cache, enabled=True)) == ["Hel"]
+    assert calls == ["paper", "paper"]
+    assert cache.stats()["namespaces"] == {}
+
+
+def test_stream_closed_by_consumer_is_not_cached():
+    cache = make_cache()
+    stream, calls = fake_stream(["Hello", " world"], completed=True)
+
+    chunks = cached_stream("paper", "academic", stream_llm=stream, cache=cache, enabled=True)
+    assert next(chunks) == "Hello"
+    chunks.close()
+
+    assert cache.lookup("academic:", "paper") is None
@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from database import db
+from database.credentials import CredentialStore
+from server import ChatServer
+
+
+@pytest.fixture(autouse=True)
+def credential_store(tmp_path, monkeypatch):
+    store = CredentialStore(str(tmp_path / "credentials.db"), rounds=4, legacy_file=None)
+    monkeypatch.setattr(db, "credential_store", store)
+    return store
+
+
+def echo_agent(user_id, chat_id, query):
+    return f"{chat_id}: {query}"
+
+
+def run_requests(requests):
+    """
+    Sign up a user on a test server, then send requests as (method, path, kwargs) tuples.
+    :return: List of (status, text) responses.
+    """
+    async def main():
+        server = ChatServer(agents={"echo": echo_agent}, write_behind=False)
+        async with TestClient(TestServer(server.build_app())) as client:
+            response = await client.post("/signup", json={"username": "alice", "password": "secret"})
+            token = (await response.json())["token"]
+            responses = []
+            for method, path, kwargs in requests:
+                response = await client.request(method, path, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+                responses.append((response.status, await response.text()))
+            return responses
+
+    return asyncio.run(main())
+
+
+def test_chat_and_history(per_user_storage):
+    responses = run_requests([
+        ("POST", "/chat", {"json": {"agent": "echo", "chat_id": "chat", "message": " hello "}}),
+        ("GET", "/history", {"params": {"chat_id": "chat", "limit": "1"}}),
+    ])
+
+    assert [status for status, _ in responses] == [200, 200]
+    assert "chat: hello" in responses[0][1]
+    assert json.loads(responses[1][1]) == [{"role": "assistant", "content": "chat: hello"}]
+
+
+def test_bad_input_is_rejected_with_400(per_user_storage):
+    responses = run_requests([
+        ("GET", "/history", {"params": {"chat_id": "chat", "limit": "many"}}),
+        ("GET", "/history", {"params": {"chat_id": "chat", "limit": "0"}}),
+        ("POST", "/chat", {"json": {"agent": "echo", "chat_id": 7, "message": "hello"}}),
+        ("POST", "/chat", {"json": {"agent": ["echo"], "chat_id": "chat", "message": "hello"}}),
+        ("POST", "/chat", {"json": ["chat", "hello"]}),
+        ("POST", "/login", {"json": {"username": None, "password": "secret"}}),
+        ("POST", "/chat", {"data": "not json"}),
+    ])
+
+    assert [status for status, _ in responses] == [400] * 7
+    assert "limit must be a positive integer" in responses[0][1]
+    assert "Fields must be strings: chat_id" in responses[2][1]
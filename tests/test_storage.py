@@ -0,0 +1,191 @@
+import pytest
+from sqlalchemy import select
+
+from database import db
+from database.migrate_storage import copy_user
+
+
+@pytest.fixture(params=["per_user_storage", "shared_storage"])
+def storage(request):
+    """
+    Every test runs against both storage backends.
+    """
+    return request.getfixturevalue(request.param)
+
+
+def message(chat_id, index, role="user", content=None):
+    return {
+        "chat_id": chat_id,
+        "message_id": f"{chat_id}_msg_{index}",
+        "content": content or f"{chat_id} message {index}",
+        "role": role,
+    }
+
+
+def add_chat(user_id, chat_id, count):
+    return db.add_messages(user_id, [message(chat_id, index) for index in range(count)])
+
+
+def test_add_messages_returns_ids_in_order(storage):
+    row_ids = add_chat("alice", "chat", 3)
+
+    assert row_ids == sorted(row_ids) and len(set(row_ids)) == 3
+    assert [row.id for row in db.get_chat_history("alice", "chat")] == row_ids
+    assert db.add_messages("alice", []) == []
+
+
+def test_add_messages_is_one_transaction(storage):
+    add_chat("alice", "chat", 1)
+
+    assert db.add_messages("alice", [message("chat", 1), dict(message("chat", 2), content=None)]) == []
+    assert len(db.get_chat_history("alice", "chat")) == 1
+
+
+def test_reads_are_scoped_to_the_user(storage):
+    alice_ids = add_chat("alice", "chat", 3)
+    bob_ids = add_chat("bob", "chat", 2)
+    add_chat("bob", "other", 1)
+
+    assert [row.content for row in db.get_chat_history("alice", "chat")] == [f"chat message {i}" for i in range(3)]
+    assert len(db.get_recent_messages("bob", "chat", limit=5)) == 2
+    assert [row.id for row in db.get_recent_messages("alice", "chat", limit=2)] == alice_ids[1:]
+    assert [row.id for row in db.get_messages_after("alice", "chat", after_id=alice_ids[0])] == alice_ids[1:]
+    assert sorted(db.get_all_chat_ids("bob")) == ["chat", "other"]
+    assert [chat_id for chat_id, _ in db.iter_recent_messages_by_chat("alice")] == ["chat"]
+    assert [row.id for row in db.get_messages_by_ids("bob", bob_ids)] == bob_ids
+    if storage.name == "shared":
+        # Ids are global in the shared layout: another user's ids must not leak
+        assert db.get_messages_by_ids("bob", alice_ids) == []
+
+
+def test_iter_recent_messages_by_chat_keeps_the_tail_of_every_chat(storage):
+    add_chat("alice", "a", 4)
+    add_chat("alice", "b", 1)
+
+    chats = {chat_id: [row.content for row in rows] for chat_id, rows in db.iter_recent_messages_by_chat("alice", 2)}
+
+    assert chats == {"a": ["a message 2", "a message 3"], "b": ["b message 0"]}
+
+
+def test_chat_summary_upsert(storage):
+    assert db.get_chat_summary("alice", "chat") == (None, 0)
+
+    db.save_chat_summary("alice", "chat", "first", 3, title="Title")
+    db.save_chat_summary("alice", "chat", "second", 7, title="Ignored")
+    db.save_chat_summary("bob", "chat", "bob's", 1)
+
+    assert db.get_chat_summary("alice", "chat") == ("second", 7)
+    assert db.get_chat_summary("bob", "chat") == ("bob's", 1)
+    table = storage.chats
+    with storage.engine("alice").connect() as connection:
+        titles = connection.execute(
+            select(table.c.title).where(table.c.id == "chat", *storage.user_filter(table, "alice"))
+        ).scalars().all()
+    assert titles == ["Title"]
+
+
+def test_search_messages_is_scoped_to_the_user(storage):
+    db.add_messages("alice", [message("chat", 0, content="graph neural networks"),
+                              message("chat", 1, content="protein folding")])
+    db.add_messages("bob", [message("chat", 0, content="graph databases")])
+    db.add_messages("alice", [message("other", 0, content="neural graph models")])
+
+    assert sorted(row.content for row in db.search_messages("alice", "graph")) == [
+        "graph neural networks", "neural graph models"
+    ]
+    assert [row.content for row in db.search_messages("bob", "graph")] == ["graph databases"]
+    assert [row.chatId for row in db.search_messages("alice", "graph", chat_id="other")] == ["other"]
+    assert db.search_messages("alice", "!!!") == []
+
+
+def test_embeddings_upsert_and_backlog(storage):
+    row_ids = add_chat("alice", "chat", 3)
+    add_chat("bob", "chat", 1)
+
+    db.store_embeddings("alice", [{"messageRowId": row_ids[0], "model": "m", "dim": 2, "vector": b"old"}])
+    db.store_embeddings("alice", [{"messageRowId": row_ids[0], "model": "m", "dim": 2, "vector": b"new"}])
+
+    assert [row.id for row in db.get_messages_without_embeddings("alice")] == row_ids[1:]
+    assert len(db.get_messages_without_embeddings("bob")) == 1
+    table = storage.message_embeddings
+    with storage.engine("alice").connect() as connection:
+        vectors = connection.execute(select(table.c.vector)).scalars().all()
+    assert vectors == [b"new"]
+
+
+def test_delete_chat_history_removes_messages_embeddings_and_summary(storage):
+    row_ids = add_chat("alice", "chat", 2)
+    add_chat("alice", "kept", 1)
+    add_chat("bob", "chat", 1)
+    db.store_embeddings("alice", [{"messageRowId": row_id, "model": "m", "dim": 2, "vector": b"v"} for row_id in row_ids])
+    db.save_chat_summary("alice", "chat", "summary", row_ids[-1])
+
+    db.delete_chat_history("alice", "chat")
+
+    assert db.get_chat_history("alice", "chat") == []
+    assert db.get_chat_summary("alice", "chat") == (None, 0)
+    assert len(db.get_chat_history("alice", "kept")) == 1
+    assert len(db.get_chat_history("bob", "chat")) == 1
+    table = storage.message_embeddings
+    with storage.engine("alice").connect() as connection:
+        assert connection.execute(select(table.c.messageRowId)).all() == []
+
+
+def test_user_exists_and_list_user_ids(storage):
+    assert not storage.user_exists("alice")
+    add_chat("alice", "chat", 1)
+    add_chat("bob", "chat", 1)
+
+    assert storage.user_exists("alice")
+    assert db.list_user_ids() == ["alice", "bob"]
+
+
+def test_copy_user_remaps_message_ids(per_user_storage, tmp_path):
+    row_ids = add_chat("alice", "chat", 3)
+    db.store_embeddings("alice", [
+        {"messageRowId": row_id, "model": "m", "dim": 2, "vector": f"vector {row_id}".encode()} for row_id in row_ids
+    ])
+    db.save_chat_summary("alice", "chat", "summary", row_ids[1])
+    per_user_storage.dispose()
+
+    target = db.SharedStorage(f"sqlite:///{tmp_path / 'shared.db'}")
+    try:
+        # Another user already owns the first ids of the shared database
+        with target.engine().begin() as connection:
+            connection.execute(target.messages.insert(), target.with_user("bob", [
+                {"chatId": "chat", "messageId": f"bob_{i}", "content": "bob", "role": "user"} for i in range(5)
+            ]))
+
+        count, id_map, embeddings = copy_user(f"{db.BASE_DB_DIR}/alice.db", target, "alice", chunk_size=2)
+
+        assert count == 3 and embeddings == 3
+        assert sorted(id_map) == row_ids
+        assert all(new_id > 5 for new_id in id_map.values())
+        with target.engine().connect() as connection:
+            messages = {
+                row.id: row for row in connection.execute(
+                    select(target.messages).where(target.messages.c.userId == "alice")
+                )
+            }
+            vectors = dict(connection.execute(
+                select(target.message_embeddings.c.messageRowId, target.message_embeddings.c.vector)
+                .where(target.message_embeddings.c.userId == "alice")
+            ).all())
+            summary = connection.execute(
+                select(target.chats.c.summary, target.chats.c.summarizedUpTo).where(target.chats.c.userId == "alice")
+            ).one()
+        for old_id, new_id in id_map.items():
+            assert messages[new_id].content == f"chat message {row_ids.index(old_id)}"
+            assert vectors[new_id] == f"vector {old_id}".encode()
+        # The summary still covers the first two messages, under their new ids
+        assert tuple(summary) == ("summary", id_map[row_ids[1]])
+
+        # --replace copies the user again without duplicating rows
+        count, _, _ = copy_user(f"{db.BASE_DB_DIR}/alice.db", target, "alice", replace=True)
+        with target.engine().connect() as connection:
+            total = connection.execute(
+                select(target.messages.c.id).where(target.messages.c.userId == "alice")
+            ).all()
+        assert count == 3 and len(total) == 3
+    finally:
+        target.dispose()
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from helper import vector_index
+
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_index.db, "BASE_DB_DIR", str(tmp_path))
+    return tmp_path
+
+
+def stored_ids(index):
+    return sorted(vector_index.faiss.vector_to_array(index.index.id_map).tolist())
+
+
+def vectors(count, seed=0):
+    return np.random.default_rng(seed).random((count, vector_index.EMBEDDING_DIM))
+
+
+def test_logged_additions_are_replayed_on_load(index_dir):
+    index = vector_index.UserVectorIndex("alice")
+    index.add([1, 2], vectors(2))
+
+    assert not index_dir.joinpath("alice.faiss").exists()
+    assert stored_ids(vector_index.UserVectorIndex("alice")) == [1, 2]
+
+
+def test_index_replaced_by_a_rebuild_is_reloaded_not_overwritten(index_dir):
+    server = vector_index.UserVectorIndex("alice")
+    server.add([1, 2, 3], vectors(3))
+    server.save(force=True)
+
+    rebuild = vector_index.UserVectorIndex("alice", load=False)
+    rebuild.add([1, 3], vectors(2), persist=False)
+    rebuild.save(force=True)
+
+    server.add([4], vectors(1, seed=1))
+    server.save()
+
+    assert stored_ids(server) == [1, 3, 4]
+    assert stored_ids(vector_index.UserVectorIndex("alice")) == [1, 3, 4]
+
+
+def test_rebuild_does_not_reload_the_file_it_replaces(index_dir, monkeypatch):
+    monkeypatch.setattr(vector_index, "RELOAD_CHECK_INTERVAL", 0)
+    vector_index.UserVectorIndex("alice").add([1, 2], vectors(2))
+
+    rebuild = vector_index.UserVectorIndex("alice", load=False)
+    rebuild.add([2], vectors(1), persist=False)
+    rebuild.save(force=True)
+
+    assert stored_ids(vector_index.UserVectorIndex("alice")) == [2]
+
+
+def test_least_recently_used_indexes_are_saved_and_evicted(index_dir, monkeypatch):
+    monkeypatch.setattr(vector_index, "MAX_CACHED_INDEXES", 2)
+    monkeypatch.setattr(vector_index, "_indexes", vector_index.OrderedDict())
+    alice = vector_index.get_user_index("alice")
+    alice.add([1], vectors(1), persist=False)
+    bob = vector_index.get_user_index("bob")
+    vector_index.get_user_index("alice")
+
+    vector_index.get_user_index("carol")
+    assert list(vector_index._indexes) == ["alice", "carol"]
+    assert vector_index.get_user_index("bob") is not bob
+
+    vector_index.get_user_index("carol")
+    vector_index.get_user_index("dave")
+    assert list(vector_index._indexes) == ["carol", "dave"]
+    assert stored_ids(vector_index.UserVectorIndex("alice")) == [1]
@@ -0,0 +1,130 @@
+import threading
+
+import pytest
+
+from database import write_behind
+from database.db import get_chat_history
+from database.write_behind import WriteBehindWriter
+
+
+def message(index, chat_id="chat"):
+    return {
+        "chat_id": chat_id,
+        "message_id": f"{chat_id}_msg_{index}",
+        "content": f"message {index}",
+        "role": "user",
+    }
+
+
+def test_close_commits_pending_messages(per_user_storage):
+    writer = WriteBehindWriter(window=60)
+    futures = [writer.submit_many("alice", [message(index)]) for index in range(3)]
+    assert writer.pending() == 3
+    assert get_chat_history("alice", "chat") == []
+
+    writer.close()
+
+    assert all(future.done() for future in futures)
+    assert [row.content for row in get_chat_history("alice", "chat")] == ["message 0", "message 1", "message 2"]
+    assert writer.pending() == 0
+
+
+def test_submit_after_close_raises(per_user_storage):
+    writer = WriteBehindWriter(window=60)
+    writer.close()
+
+    with pytest.raises(RuntimeError):
+        writer.submit("alice", "chat", "msg", "hello", "user")
+
+
+def test_flush_makes_messages_durable(per_user_storage):
+    writer = WriteBehindWriter(window=60)
+    future = writer.submit("alice", "chat", "msg", "hello", "user")
+
+    writer.flush()
+
+    assert future.result(timeout=0) == [1]
+    assert [row.content for row in get_chat_history("alice", "chat")] == ["hello"]
+    writer.close()
+
+
+def test_messages_in_one_window_share_a_commit(per_user_storage):
+    writer = WriteBehindWriter(window=60)
+    futures = [writer.submit_many(user_id, [message(0), message(1)]) for user_id in ("alice", "alice", "bob")]
+
+    writer.close()
+
+    assert writer.commits == 2  # One transaction per user
+    assert writer.committed == 6
+    assert [future.result() for future in futures] == [[1, 2], [3, 4], [1, 2]]
+
+
+def test_messages_of_a_user_are_committed_in_submission_order(per_user_storage):
+    writer = WriteBehindWriter(window=0.001, max_batch=4)
+    futures = [writer.submit_many("alice", [message(index)]) for index in range(50)]
+
+    row_ids = [future.result(timeout=10)[0] for future in futures]
+    writer.close()
+
+    assert row_ids == sorted(row_ids)
+    assert [row.content for row in get_chat_history("alice", "chat")] == [f"message {index}" for index in range(50)]
+
+
+def test_batch_is_committed_before_the_window_ends_when_full(per_user_storage):
+    writer = WriteBehindWriter(window=60, max_batch=2)
+    future = writer.submit_many("alice", [message(0), message(1)])
+
+    assert future.result(timeout=10) == [1, 2]
+    writer.close()
+
+
+def test_constraint_failure_only_drops_the_rejected_batch(per_user_storage):
+    writer = WriteBehindWriter(window=60)
+    before = writer.submit_many("alice", [message(0), message(1)])
+    rejected = writer.submit_many("alice", [message(2), dict(message(3), content=None)])  # content is NOT NULL
+    after = writer.submit_many("alice", [message(4)])
+    other_user = writer.submit_many("bob", [message(5)])
+
+    writer.close()
+
+    # The group commit is rolled back, then every batch is retried in its own transaction
+    assert rejected.result() == []
+    assert len(before.result()) == 2 and len(after.result()) == 1
+    assert [row.messageId for row in get_chat_history("alice", "chat")] == [
+        "chat_msg_0", "chat_msg_1", "chat_msg_4"
+    ]
+    assert other_user.result() == [1]
+    assert writer.committed == 4
+
+
+def test_other_errors_are_set_on_the_futures(per_user_storage, monkeypatch):
+    def locked(user_id, rows):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(write_behind, "add_messages", locked)
+    writer = WriteBehindWriter(window=60)
+    futures = [writer.submit_many("alice", [message(index)]) for index in range(2)]
+
+    writer.close()
+
+    assert all(isinstance(future.exception(), RuntimeError) for future in futures)
+    assert writer.committed == 0
+
+
+def test_concurrent_submitters_lose_no_messages(per_user_storage):
+    writer = WriteBehindWriter(window=0.005)
+
+    def submit(chat_id):
+        for index in range(20):
+            writer.submit_many("alice", [message(index, chat_id=chat_id)])
+
+    threads = [threading.Thread(target=submit, args=(f"chat_{number}",)) for number in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.close()
+
+    for number in range(4):
+        history = get_chat_history("alice", f"chat_{number}")
+        assert [row.content for row in history] == [f"message {index}" for index in range(20)]